@@ -295,30 +295,119 @@ def folderTree2List(tree, filters=[], base=""):
         for filter in filters:
             if not filter:
                 continue
-            if filter in value[matches]
-                continue
-            else:
-                ok = False
-                break
             if filter[0] == '!':
-                filter = filter[1:]
-                if not (filter in value[matches])
+                if not (filter[1:] in value['matches']):
                     continue
-            else:
-                ok = False
-                break
+            elif filter in value['matches']:
+                continue
+            ok = False
+            break
         if not ok:
             continue
-        if value[type] = 'folder'):
-            out = out + folderTree2List(value, filters, key)
+        if value['type'] == 'folder':
+            out = out + folderTree2List(value['content'], filters, os.path.join(base, key))
         else:
             out.append(os.path.join(base, key))
-        return out
+    return out
+
+# The modules of the command line modes are in src/
+# they are imported only when needed, to keep the startup fast
+def _import(name):
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+    if not src in sys.path: sys.path.insert(0, src)
+    return __import__(name)
+
+# Yields the paths read from a stream
+# - separator : '\n' or '\0'
+# paths are yielded as soon as they are read (i.e. the stream may be a pipe)
+def _readPaths(stream, separator):
+    if separator == '\n':
+        for line in iter(stream.readline, ''):
+            line = line.rstrip('\r\n')
+            if line: yield line
+        return
+    pending = ''
+    fd = stream.fileno()
+    while True:
+        chunk = os.read(fd, 65536)
+        if not chunk: break
+        paths = (pending + chunk).split(separator)
+        pending = paths.pop()
+        for path in paths:
+            if path: yield path
+    if pending: yield pending
+
+# check-ignore mode: prints the ignored paths (like git check-ignore)
+# the rules files are read once, whatever the count of paths
+def _checkIgnore(args):
+    applyRules = _import('applyRules')
+    checker = applyRules.Checker(args.root, args.rules)
+    separator = '\0' if args.z else '\n'
+    paths = _readPaths(sys.stdin, separator) if args.stdin else args.paths
+    write = sys.stdout.write
+    found = False
+    for path in paths:
+        try:
+            ignored = len(checker.check(path)) > 0
+        except applyRules.OutsideRoot as e:
+            sys.stdout.flush()
+            sys.stderr.write('fatal: %s\n' % e)
+            return 128
+        found = found or ignored
+        if args.verbose:
+            rule = checker.rule(path) if ignored else None
+            if rule is None and not args.non_matching: continue
+            name, pattern = ('', '') if rule is None else (rule[0], rule[1].pattern)
+            if args.z:
+                write(name + '\0' + pattern + '\0' + path + '\0')
+            else:
+                write(name + ':' + pattern + '\t' + path + '\n')
+        elif ignored:
+            write(path + separator)
+        if args.line_buffered: sys.stdout.flush()
+    sys.stdout.flush()
+    return 0 if found else 1
+
+# list mode: prints the paths of a whole tree, based on filters
+def _list(args):
+    applyRules = _import('applyRules')
+    write = sys.stdout.write
+    separator = '\0' if args.z else '\n'
+    for path, isDir, matches in applyRules.iterpaths(args.root, args.rules, args.filter):
+        write(path + ('/' if isDir and args.mark_dirs else '') + separator)
+    sys.stdout.flush()
+    return 0
+
+def _main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='gitIgnorePython')
+    commands = parser.add_subparsers(dest='command')
+    check = commands.add_parser('check-ignore', help='prints the ignored paths')
+    check.add_argument('paths', nargs='*', help='paths relative to the root (folders may end with /)')
+    check.add_argument('-r', '--root', default='.', help='the root folder (default: .)')
+    check.add_argument('--stdin', action='store_true', help='reads the paths from stdin')
+    check.add_argument('-z', action='store_true', help='paths are NUL delimited (input and output)')
+    check.add_argument('-v', '--verbose', action='store_true', help='prints the ruleset and the rule of every ignored path')
+    check.add_argument('-n', '--non-matching', action='store_true', help='with --verbose, prints the not ignored paths too')
+    check.add_argument('--line-buffered', action='store_true', help='flushes the output after every path')
+    check.add_argument('--rules', action='append', help='rules files (default: .gitignore)')
+    listing = commands.add_parser('list', help='prints the paths of a tree')
+    listing.add_argument('root')
+    listing.add_argument('--filter', action='append', default=[], help='i.e. !.gitignore to list the not ignored paths')
+    listing.add_argument('-z', action='store_true', help='paths are NUL delimited')
+    listing.add_argument('--mark-dirs', action='store_true', help='folders end with /')
+    listing.add_argument('--rules', action='append', help='rules files (default: .gitignore)')
+    args = parser.parse_args(argv)
+    if args.command == 'check-ignore':
+        return _checkIgnore(args)
+    return _list(args)
 
 if __name__ == "__main__":
     if (len(sys.argv) <= 1):
         sys.stderr.write("Missing path\n")
         sys.exit(1)
+    if sys.argv[1] in ['check-ignore', 'list', '-h', '--help']:
+        sys.exit(_main(sys.argv[1:]))
     rootPath = sys.argv[1]
     if (not os.path.exists(rootPath) or not os.path.isdir(rootPath)):
         sys.stderr.write("invalid path\n")
@@ -328,6 +417,6 @@ if __name__ == "__main__":
         matches, nomatches = getList(rootPath, ['.git'], True, True)
         for m in matches: print m
     else:
-        tree = getFolderTree(rootPath, True, )
+        tree = getFolderTree(rootPath)
 
         #for l in sorted(folderTree2List(tree)): print l
@@ -1,7 +1,10 @@
 #!/usr/bin/python
 import re
 import os
+import collections
+import sys
 import folderTree
+import stats
 
 class _SpecialMarker:
     def __init__(self, pattern, exist, lead, inter, trail):
@@ -19,90 +22,172 @@ class _SpecialMarker:
 # A Rule is
 # - pattern: a string (like "**/*") which will be used by "applyRules" module
 # - ishidden: if true, they are internally generated, and can be removed
+# - negate: if true, the rule re-includes what it matches ("!pattern")
 # - slash/dstar: some precomputed helpers to describ the pattern
+# - source: (filepath, line number, line) of the rule as written in its file
+#           (None if unknown), a hidden rule keeps the source of its rule
 class Rule:
-    def __init__(self, pattern, ishidden = False):
+    negate = False
+    source = None
+    def __init__(self, pattern, ishidden = False, negate = False, source = None):
         self.pattern = pattern
         self.ishidden = ishidden
+        self.negate = negate
+        self.source = source
         self.slash = _SpecialMarker(pattern, '/', '/',  '.+\/.+', '/')
         self.dstar = _SpecialMarker(pattern, '**', '**/', '.+\/\*\*\/.+', '/**')
     def __str__(self):
         s = '[' + self.pattern + ']'
         s = s + '\n - ishidden: ' + str(self.ishidden)
+        s = s + '\n - negate: ' + str(self.negate)
         s = s + '\n - slash: ' + str(self.slash) + ')'
         s = s + '\n - dstar: ' + str(self.dstar) + ')'
         return s
 
+# Returns the key of a Rule in a RuleSet, i.e. (pattern, negate)
+# - patternOrRule : a Rule, or a pattern as written in a rules file
+#                   ("!foo" is the negation of foo, "\!foo" the pattern !foo)
+def _key(patternOrRule):
+    if isinstance(patternOrRule, Rule):
+        return (patternOrRule.pattern, patternOrRule.negate)
+    pattern = patternOrRule
+    if len(pattern) > 1 and pattern[0] == '\\' and pattern[1] == '!':
+        return (pattern[1:], False)
+    if len(pattern) > 0 and pattern[0] == '!':
+        return (pattern[1:], True)
+    return (pattern, False)
+
 # A RuleSet is actually a wrapper on
-# a List of Rule
+# an ordered Dictionnary of Rule, the keys being the rules (pattern, negate)
 # note: despite of regular Python List
-#       append(rule) makes sure that the rule.pattern is unique
+#       append(rule) makes sure that the rule (pattern, negate) is unique
+#       a rule appended again is moved to the end (the last rule wins)
+# - version : incremented on every change (see compileRules.compile)
+# - compiled : the CompiledRuleSet cache (see compileRules.compile)
+# - indexed : (version, list of Rule) for indexing, rebuilt on the first
+#             indexing after a change, so that rs[i] is O(1) between changes
 class RuleSet:
     def __init__(self, rules = None):
-        self.rules = []
+        self.rules = collections.OrderedDict()
+        self.version = 0
+        self.compiled = None
+        self.indexed = None
         if not rules is None:
             for rule in rules:
                 self.append(rule)
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['compiled'] = None
+        state['indexed'] = None
+        return state
     def __iter__(self):
-        return self.rules.__iter__()
+        return self.rules.itervalues()
+    def __list(self):
+        if self.indexed is None or not self.indexed[0] == self.version:
+            self.indexed = (self.version, self.rules.values())
+        return self.indexed[1]
+    # note: replacing a rule by one of another (pattern, negate) rebuilds the RuleSet (O(n))
     def __setitem__(self, i, v):
-        self.rules.__setitem__(i, v)
+        if not isinstance(v, Rule):
+            raise Exception('Rule type excepted !')
+        rules = self.__list()
+        key = _key(rules[i])
+        if key == _key(v):
+            self.rules[key] = v
+            rules[i] = v
+            self.version = self.version + 1
+            self.indexed = (self.version, rules)
+            return self
+        rules = list(rules)
+        rules[i] = v
+        self.rules = collections.OrderedDict()
+        for rule in rules:
+            self.rules[_key(rule)] = rule
+        self.version = self.version + 1
         return self
     def __getitem__(self, i):
-        return self.rules.__getitem__(i)
+        return self.__list()[i]
     def __len__(self):
         return len(self.rules)
     def __str__(self):
         s = '['
         coma = ''
-        for rule in self.rules:
+        for rule in self:
             s = s + coma 
+            pattern = rule.pattern
+            if rule.negate:
+                pattern = '!' + pattern
+            elif pattern[0:1] == '!':
+                pattern = '\\' + pattern
             if rule.ishidden:
-                s = s + '(\'' + rule.pattern + '\')'
+                s = s + '(\'' + pattern + '\')'
             else:
-                s = s + '\'' + rule.pattern + '\''
+                s = s + '\'' + pattern + '\''
             coma = ', '
         s = s + ']' 
         return s
     def append(self, rule):
         if not isinstance(rule, Rule):
             raise Exception('Rule type excepted !')
-        notFound = True
-        for idx in range(0, len(self.rules)):
-            if self.rules[idx].pattern == rule.pattern:
-                notFound = False
-                self.rules[idx] = rule
-        if notFound: self.rules.append(rule)
+        key = _key(rule)
+        if key in self.rules: del self.rules[key]
+        self.rules[key] = rule
+        self.version = self.version + 1
         return self
     def remove(self, patternOrRule):
-        pattern = patternOrRule
-        if isinstance(patternOrRule, Rule):
-            pattern = patternOrRule.pattern
-        newRules = []
-        for rule in self.rules:
-            if not rule.pattern == pattern:
-                newRules.append(rule)
-        self.rules = newRules
+        key = _key(patternOrRule)
+        if key in self.rules:
+            del self.rules[key]
+            self.version = self.version + 1
         return self
-    def loadfromfile(self, filepath):
-        self.rules = []
+    # Loads the rules of a file
+    # - cache : a ruleCache.RuleCache (default: ruleCache.current())
+    def loadfromfile(self, filepath, cache = None):
+        self.rules = collections.OrderedDict()
+        self.version = self.version + 1
         if (not os.path.exists(filepath) or os.path.isdir(filepath)): return self
-        f = open(filepath, "rb") 
-        s = f.read()
-        f.close()
-        for line in s.splitlines():
-            line = line.strip()
-            if len(line) == 0:
-                continue
-            if line[0] == '#':
-                continue
-            if len(line) > 1 and line[0] == '\\' and line[1] == '#':
-                line = line[1:]
-            elif len(line) > 1 and line[0] == '\\' and line[1] == '!':
-                line = line[1:]
-            self.append(Rule(line))
+        cache = _currentRuleCache() if cache is None else cache
+        rules = None if cache is None else cache.get(filepath)
+        if rules is None:
+            rules = _parse(filepath)
+            if not cache is None: cache.set(filepath, rules)
+        for rule in rules:
+            self.append(rule)
         return self
 
+# Returns the ruleCache.RuleCache in use (or None)
+# ruleCache is imported by whoever enables a cache (see folderTree.currentDirCache)
+def _currentRuleCache():
+    module = sys.modules.get('ruleCache')
+    return None if module is None else module.current()
+
+# Returns the list of Rule of a file
+def _parse(filepath):
+    out = []
+    f = open(filepath, "rb") 
+    s = f.read()
+    f.close()
+    number = 0
+    for line in s.splitlines():
+        number = number + 1
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        if line[0] == '#':
+            continue
+        source = (filepath, number, line)
+        if len(line) > 1 and line[0] == '\\' and line[1] == '#':
+            line = line[1:]
+        elif len(line) > 1 and line[0] == '\\' and line[1] == '!':
+            line = line[1:]
+        # An optional prefix "!" which negates the pattern;
+        # any matching file excluded by a previous pattern will become included again.
+        elif line[0] == '!':
+            if len(line) > 1: out.append(Rule(line[1:], False, True, source))
+            continue
+        out.append(Rule(line, False, False, source))
+    return out
+
 # Add a ruleset in a folderitem
 def add(folderitem, name, ruleset):
     if folderitem is None: return
@@ -118,7 +203,8 @@ def add(folderitem, name, ruleset):
 # Add a ruleset in a tree base on filename
 # The whole tree will be recursily read to find 'filename' file
 def addFromFile(tree, filename = '.gitignore'):
-    return __addFromFile(tree, filename, '', None)
+    with stats.phase('load'):
+        return __addFromFile(tree, filename, '', None)
 def __addFromFile(tree, filename, path, parent):
     for key in tree:
         value = tree[key]
@@ -172,7 +258,23 @@ if __name__ == "__main__":
     if rs2[2].ishidden: raise Exception()
     rs2[2] = Rule("**/*", True)
     if not rs2[2].ishidden: raise Exception()
+    rs2[0] = Rule(".bar")
+    if not (str(rs2) == "['.bar', '/a/a/b', ('**/*')]" and rs2[0].pattern == '.bar'): raise Exception(rs2)
+    rs2.remove(".bar")
+    if not rs2[0].pattern == '/a/a/b': raise Exception('indexing after a change')
     rs3 = RuleSet([Rule("*"), Rule("abc")])
+    version = rs3.version
+    rs3.append(Rule("abc"))
+    if not rs3.version > version: raise Exception('version')
+    if not [r.pattern for r in rs3] == ["*", "abc"]: raise Exception('order')
+    rs4 = RuleSet([Rule("abc"), Rule("abc", False, True), Rule("!abc")])
+    if not str(rs4) == "['abc', '!abc', '\\!abc']": raise Exception(rs4)
+    rs5 = RuleSet([Rule("*.log"), Rule("important.log", False, True), Rule("*.log")])
+    if not str(rs5) == "['!important.log', '*.log']": raise Exception(rs5)
+    rs4.remove("!abc")
+    if not len(rs4) == 2 or rs4[1].negate: raise Exception(rs4)
+    rs4.remove("\\!abc")
+    if not len(rs4) == 1: raise Exception(rs4)
 
     tree = folderTree.get('test')
     add(tree.first(), "rs1", rs1) # empty (skipped)
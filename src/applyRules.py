@@ -1,150 +1,518 @@
 #!/usr/bin/python
-import re
 import os
 import folderTree
 import addRules
+import ruleContext
+import stats
 
-def _matchOneRule(path, isDir, ruleset, dbgLog=False):
-    path = path.replace('\\', '/')
+# Returns the effective rulesets of a folder (a ruleContext.Context)
+# i.e. the rules inherited from parent folders followed by the folder's own rules
+# - local : the folder's own rulesets (see FolderItem.rulesets)
+# - inherited : a Context, or a Dictionnary of RuleSet
+def folderContext(local, inherited):
+    if not isinstance(inherited, ruleContext.Context):
+        inherited = ruleContext.get(inherited)
+    return inherited.extend(local)
 
-    if dbgLog: print "matchOnePattern on ", path
-
-    dbgIdx = 0
-    for rule in rs.ruleset:
-        dbgIdx = dbgIdx + 1
-
-        pattern = rule.pattern
-
-        # R4
-        # If the pattern ends with a slash,
-        # it is removed for the purpose of the following description,
-        # but it would only find a match with a directory.
-        # In other words, foo/ will match a directory foo and paths underneath it,
-        # but will not match a regular file or a symbolic link foo
-        # (this is consistent with the way how pathspec works in general in Git).
-        if rule.slash.trail:
-            if isDir:
-                tmp = pattern[:-1]
-                if dbgLog: print dbgIdx, ":", "R4[", pattern, "] - remove trailing slash, pattern becomes: [", tmp ,"]"
-                pattern = tmp
-            else:
-                continue
-
-        # R5
-        # If the pattern does not contain a slash /,
-        # Git treats it as a shell glob pattern
-        # and checks for a match against the pathname relative
-        # to the location of the .gitignore file
-        # (relative to the toplevel of the work tree if not from a .gitignore file).
-        if not rule.slash.exist:
-            if fnmatch.fnmatch(path, pattern):
-                if dbgLog: print dbgIdx, ":", "R5[", pattern, "] - match shell glob pattern"
-                if dbgLog: print "OK"
-                return True
-        
-        # R6
-        # Otherwise, Git treats the pattern as a shell glob:
-        #   "*" matches anything except "/",
-        #   "?" matches any one character except "/"
-        #   and "[]" matches one character in a selected range.
-        #7 See fnmatch(3) and the FNM_PATHNAME flag for a more detailed description.
-        # -------> i.e. NO propagation
+# Returns the rulesets read from a folder
+# - items : the folder content (see folderTree.scan)
+# - filenames : rules files to read (ruleset name is the filename)
+def _load(path, items, filenames):
+    out = {}
+    for key, isdir, stat in items:
+        if not isdir and key in filenames:
+            rs = addRules.RuleSet().loadfromfile(os.path.join(path, key))
+            if len(rs) > 0: out[key] = rs
+    return out
+
+# Returns a signature of a context (see dirCache)
+# i.e. a digest of its patterns and of the parent matches
+def _signature(context, parentMatches):
+    # imported here, as it is only used along with dirCache
+    import hashlib
+    digest = hashlib.md5(context.digest())
+    digest.update('\2'.join(sorted(folderTree.toMatches(parentMatches))))
+    return digest.hexdigest()
+
+# Yields the matches of every item of a folder
+# They come from dirCache if it is enabled, and if the context is the same
+def _folderMatches(path, items, context, parentMatches):
+    cache = folderTree.currentDirCache()
+    if cache is None:
+        compiled = context.compiled()
+        for key, isdir, stat in items:
+            yield _matches(key, isdir, compiled, parentMatches)
+        return
+    signature = _signature(context, parentMatches)
+    cached = cache.matches(path, signature)
+    if not cached is None and len(cached) == len(items):
+        for names in cached:
+            yield folderTree.toMatches(names)
+        return
+    out = []
+    compiled = context.compiled()
+    for key, isdir, stat in items:
+        matches = _matches(key, isdir, compiled, parentMatches)
+        out.append(list(matches))
+        yield matches
+    cache.setMatches(path, signature, out)
+
+# Returns the matches of an item
+# - parentMatches : an ignored folder makes its whole content ignored
+def _matches(key, isDir, compiled, parentMatches):
+    out = parentMatches
+    for bit, crs in compiled:
+        if not out & bit and crs.match(key, isDir):
+            out = out | bit
+    return folderTree.Matches(out)
+
+# Returns the task of a root folder (see iterfolder)
+def roottask(path):
+    return (path, ruleContext.EMPTY, 0)
+
+# Returns compiled filters (see folderTree.compileFilters)
+# the ruleset names get their bits first, for the filters to know them
+def compileFilters(filenames, filters = None):
+    folderTree.toMatches(filenames)
+    return folderTree.compileFilters([] if filters is None else filters)
+
+# Yields (name, isDir, matches, subtask) for every item of a folder
+# This is the step of every walk: the folder's rules files are read,
+# its items are matched, and a sub folder comes with the task to walk it
+# - task : (path, inherited Context, parent matches), see roottask
+#          subtask is the task of a sub folder (None for a file)
+# - filenames : rules files to read (ruleset name is the filename)
+# - filters : see compileFilters, a filtered out item is skipped
+# - items : the folder content if already listed (see folderTree.scan)
+# - rulesets : if not None, a Dictionnary which receives the folder's own rulesets
+def iterfolder(task, filenames, filters = None, items = None, rulesets = None):
+    path, inherited, parentMatches = task
+    items = list(folderTree.scan(path)) if items is None else items
+    local = _load(path, items, filenames)
+    if not rulesets is None: rulesets.update(local)
+    context = folderContext(local, inherited)
+    required, forbidden = (0, 0) if filters is None else filters
+    allMatches = list(_folderMatches(path, items, context, parentMatches))
+    for i in range(0, len(items)):
+        key, isdir, stat = items[i]
+        matches = allMatches[i]
+        if not (matches & required) == required or matches & forbidden:
+            continue
+        yield key, isdir, matches, (os.path.join(path, key), context.sub(key), matches) if isdir else None
+
+# Fill up .matches of every item of a tree
+# based on the rulesets hold by its folders (see addRules)
+# - processes : if more than 1, matches are computed by 'processes' worker processes
+def apply(tree, processes = 0):
+    with stats.phase('match'):
+        if processes > 1:
+            return __applyParallel(tree, processes)
+        for key in tree:
+            __apply(tree[key].content, tree[key], {}, 0)
+def __applyParallel(tree, processes):
+    for key in tree:
+        paths = []
+        rulesets = {}
+        items = {}
+        __collect(tree[key], '', paths, rulesets, items)
+        for path, isDir, matches in classify(paths, rulesets, processes):
+            items[path].matches = matches
+def __collect(folder, base, paths, rulesets, items):
+    if len(folder.rulesets) > 0: rulesets[base] = folder.rulesets
+    for key in folder.content:
+        value = folder.content[key]
+        path = base + '/' + key if base else key
+        if value.type == folderTree.FOLDER:
+            paths.append(path + '/')
+            items[path + '/'] = value
+            __collect(value, path, paths, rulesets, items)
         else:
+            paths.append(path)
+            items[path] = value
+def __apply(tree, parent, inherited, parentMatches):
+    context = folderContext(parent.rulesets, inherited)
+    compiled = context.compiled()
+    for key in tree:
+        value = tree[key]
+        isDir = value.type == folderTree.FOLDER
+        value.matches = _matches(key, isDir, compiled, parentMatches)
+        if isDir:
+            __apply(value.content, value, context.sub(key), value.matches)
 
-            # Note at this point there is NO trailing slash (see R4)
-            lPattern = pattern
-            if dbgLog: print dbgIdx, ":", "R6[", lPattern, "] - slashes detected, switch to pattern to local pattern"
-
-            # R7
-            # A leading slash matches the beginning of the pathname.
-            # For example, "/*.c" matches "cat-file.c" but not "mozilla-sha1/sha1.c".
-            # -------> i.e. NO propagation
-            if rule.slash.lead:
-                tmp = lPattern[1:]
-                if dbgLog: print dbgIdx, ":", "R7[", lPattern, "] - remove leading slash, local pattern becomes: [", tmp ,"]"
-                lPattern = tmp
-            # Note at this point there is NO leading slash (see R7), only intermediate
-
-            if not rule.dstar.exist:
-
-                if rule.slash.inter:
-                    if isDir:
-                        tmp = lPattern.split('/')[0]
-                        if dbgLog: print dbgIdx, ":", "R.[", lPattern, "] - intermediate slash on directory, local pattern becomes: [", tmp ,"]"
-                        lPattern = tmp
-                    else:
-                        continue
-                # No more slashes at this point
-
-                if fnmatch.fnmatch(path, lPattern):
-                    if dbgLog: print dbgIdx, ":", "R6[", lPattern, "] - match shell glob on local pattern"
-                    if dbgLog: print "OK"
-                    return True
-
-            # R8
-            # A leading "**" followed by a slash means match in all directories.
-            # For example, "**/foo" matches file or directory "foo" anywhere,
-            # the same as pattern "foo".
-            if rule.dstar.lead:
-                tmp = pattern[3:]
-                if dbgLog: print dbgIdx, ":", "R8[", lPattern, "] - remove leading '**/', local pattern becomes: [", tmp ,"]"
-                lPattern = tmp
-                if not isDir and fnmatch.fnmatch(path, lPattern):
-                    if dbgLog: print dbgIdx, ":", "R8[", lPattern, "] -  match shell glob on local pattern (on file)"
-                    if dbgLog: print "OK"
-                    return True
-
-            # Note at this point there is NO leading dstar, so we only deals with subfolder
-
-            if isDir:
-                tmp = lPattern.split('/')[0]
-                if dbgLog: print dbgIdx, ":", "R.[", lPattern, "] - intermediate slash on directory, local pattern becomes: [", tmp ,"]"
-                lPattern = tmp
-            else:
-                continue
-
-            # R9
-            # "**/foo/bar" matches file or directory "bar" anywhere that
-            # is directly under directory "foo".
-            # ---------> like R6 WITH propagation
-            # R10
-            # A trailing "/**" matches everything inside.
-            # For example, "abc/**" matches all files inside directory "abc",
-            # relative to the location of the .gitignore file, with infinite depth.
-            # -------> i.e. NO propagation
-            if lPattern == "**":
-                if dbgLog: print dbgIdx, ":", "R9[", lPattern, "] -  double dot match any folder!"
-                if dbgLog: print "OK"
-                return True
-            else:
-                if fnmatch.fnmatch(path, lPattern):
-                    if dbgLog: print dbgIdx, ":", "R8[", lPattern, "] -  match shell glob on local pattern (on folder)"
-                    if dbgLog: print "OK"
-                    return True
+# Returns a new Tree Object based on its content, with .matches filled up
+# This is a single pass version of folderTree.get + addRules.addFromFile + apply
+# - filenames : rules files to read while entering a folder (ruleset name is the filename)
+# - prune : rulesets names which make a matching folder NOT listed (default: filenames)
+#           the folder is still part of the tree, but with an empty content
+def walk(path, filenames = None, prune = None):
+    filenames = ['.gitignore'] if filenames is None else filenames
+    prune = folderTree.toMatches(filenames if prune is None else prune)
+    out = folderTree.Tree()
+    out[path] = folderTree.FolderItem(None, folderTree.Tree())
+    with stats.phase('singlepass'):
+        __walk(roottask(path), out[path], filenames, prune)
+    return out
+def __walk(task, parent, filenames, prune):
+    parent.rulesets = {}
+    for key, isdir, matches, subtask in iterfolder(task, filenames, None, None, parent.rulesets):
+        if isdir:
+            value = folderTree.FolderItem(matches, folderTree.Tree())
+            if not matches & prune:
+                __walk(subtask, value, filenames, prune)
+        else:
+            value = folderTree.FileItem(matches)
+        parent.content[key] = value
+
+# Yields (path, isDir, matches) for every item below 'path'
+# Rules are read and applied on the fly, no Tree is built
+# - rulesets : rules files to read while entering a folder (ruleset name is the filename)
+# - filters : see folderTree.tolist, a filtered out folder is not listed
+# matches are folderTree.Matches
+def iterpaths(path, rulesets = None, filters = None):
+    rulesets = ['.gitignore'] if rulesets is None else rulesets
+    return __iterpaths(roottask(path), '', rulesets, compileFilters(rulesets, filters))
+def __iterpaths(task, base, rulesets, filters):
+    for key, isdir, matches, subtask in iterfolder(task, rulesets, filters):
+        newbase = os.path.join(base, key)
+        yield newbase, isdir, matches
+        if isdir:
+            for item in __iterpaths(subtask, newbase, rulesets, filters):
+                yield item
+
+# Returns a path relative to the tree root
+# - path : either relative to the tree root, or a path below the tree root
+def relativePath(root, path):
+    apath = os.path.abspath(path)
+    aroot = os.path.abspath(root)
+    if apath == aroot: return ''
+    if apath.startswith(aroot + os.sep): return apath[len(aroot) + 1:]
+    path = os.path.normpath(path)
+    return '' if path == '.' else path
 
+# Returns the list of (name, FolderItem) from the tree root to 'relpath'
+# (None if 'relpath' is not a folder of the tree)
+def folderLineage(tree, relpath):
+    root = tree.first()
+    out = [('', root)]
+    for name in relpath.split(os.sep):
+        if not name: continue
+        content = out[-1][1].content
+        if not name in content or not content[name].type == folderTree.FOLDER: return None
+        out.append((name, content[name]))
+    return out
 
-    if dbgLog: print "NOK"
+# Returns True if two dictionnaries of RuleSet differ
+def _differ(rulesets, others):
+    if not sorted(rulesets.keys()) == sorted(others.keys()): return True
+    for name in rulesets:
+        if not [addRules._key(rule) for rule in rulesets[name]] == [addRules._key(rule) for rule in others[name]]: return True
     return False
 
-def apply(tree):
-    __apply(tree, '', tree.first())
-def __apply(tree, path, parent):
-    print '__apply(', path, ')'
-    if parent is None: return None
+# Updates a Tree (see apply or walk) after some file system changes
+# Only the folders holding the changed paths are listed again,
+# .matches are computed for new items only, or for the whole folder
+# content if the folder rules files have changed
+# - changedPaths : added, removed or modified paths
+# - filenames : rules files (ruleset name is the filename)
+# - prune : rulesets names which make a matching folder NOT listed (default: filenames)
+#           as for walk: a change below a pruned folder is ignored,
+#           and an added folder is not listed if it is pruned
+# Returns the list of the updated folders (relative to the tree root)
+def update(tree, changedPaths, filenames = None, prune = None):
+    filenames = ['.gitignore'] if filenames is None else filenames
+    prune = folderTree.toMatches(filenames if prune is None else prune)
+    root = list(tree)[0]
+    folders = set()
+    for path in changedPaths:
+        relpath = relativePath(root, path)
+        if _pruned(tree, relpath, prune): continue
+        folders.add(os.path.dirname(relpath))
+        if not folderLineage(tree, relpath) is None: folders.add(relpath)
+    out = []
+    for relpath in sorted(folders, key=lambda p: len(p)):
+        lineage = folderLineage(tree, relpath)
+        while lineage is None:
+            relpath = os.path.dirname(relpath)
+            lineage = folderLineage(tree, relpath)
+        if relpath in out: continue
+        __update(os.path.join(root, relpath), lineage, filenames, prune)
+        out.append(relpath)
+    return out
+def __update(path, lineage, filenames, prune):
+    inherited = {}
+    for i in range(1, len(lineage)):
+        inherited = folderContext(lineage[i - 1][1].rulesets, inherited).sub(lineage[i][0])
+    parent = lineage[-1][1]
+    parentMatches = parent.matches if len(lineage) > 1 else 0
+    content = parent.content
+    items = list(folderTree.scan(path))
+
+    # listing
+    types = {}
+    for key, isdir, stat in items:
+        types[key] = folderTree.FOLDER if isdir else folderTree.FILE
+    for key in list(content):
+        if not types.get(key) == content[key].type:
+            del content[key]
+    added = []
+    for key, isdir, stat in items:
+        if key in content: continue
+        if isdir:
+            # listed once its matches are known (see __walk)
+            content[key] = folderTree.FolderItem(None, folderTree.Tree())
+        else:
+            content[key] = folderTree.FileItem()
+        added.append(key)
+
+    # matches
+    rulesets = _load(path, items, filenames)
+    if _differ(parent.rulesets, rulesets):
+        parent.rulesets = rulesets
+        __apply(content, parent, inherited, parentMatches)
+        __unprune(path, content, folderContext(parent.rulesets, inherited), filenames, prune)
+        return
+    context = folderContext(parent.rulesets, inherited)
+    compiled = context.compiled()
+    for key in added:
+        value = content[key]
+        isDir = value.type == folderTree.FOLDER
+        value.matches = _matches(key, isDir, compiled, parentMatches)
+        if isDir and not value.matches & prune:
+            __walk((os.path.join(path, key), context.sub(key), value.matches), value, filenames, prune)
+
+# Returns True if a path is below a pruned folder, or is a pruned folder (see walk)
+def _pruned(tree, relpath, prune):
+    folder = tree.first()
+    for name in relpath.split(os.sep):
+        if not name: continue
+        if not name in folder.content: return False
+        value = folder.content[name]
+        if not value.type == folderTree.FOLDER: return False
+        if not value.matches is None and value.matches & prune: return True
+        folder = value
+    return False
+
+# Lists the folders which were pruned by walk (i.e. with an empty content)
+# and which are not ignored anymore
+def __unprune(path, tree, context, filenames, prune):
     for key in tree:
         value = tree[key]
-        newpath = os.path.join(path, key)
-        print '--', newpath
-        for rs in parent.rulesets:
-            #computeMatch(value)
-            value.matches = ['yo']
-        print value
+        if not value.type == folderTree.FOLDER or value.matches & prune: continue
+        sub = context.sub(key)
+        if len(value.content) == 0:
+            __walk((os.path.join(path, key), sub, value.matches), value, filenames, prune)
+        else:
+            __unprune(os.path.join(path, key), value.content, folderContext(value.rulesets, sub), filenames, prune)
 
-        if value.type == folderTree.FOLDER:
-            __apply(value.content, newpath, value)
+# Returns (folders names, isDir, path) of a path (see classify)
+def _split(path):
+    path = path.replace('\\', '/')
+    if path[0:2] == './': path = path[2:]
+    return path.strip('/').split('/'), path[-1:] == '/', path
+
+# Yields (path, isDir, matches) for a list of paths, without any disk access
+# Paths are sorted so that the rules context of a folder is computed once
+# - paths : paths relative to the root, folders end with '/'
+# - rulesets : a Dictionnary of folder path ('' for the root)
+#              to the Dictionnary of RuleSet defined in this folder
+# - processes : if more than 1, paths are shared by top folder
+#               between 'processes' worker processes
+# - chunksize : maximum count of paths sent at once to a worker process
+def classify(paths, rulesets = None, processes = 0, chunksize = 50000):
+    rulesets = {} if rulesets is None else rulesets
+    if processes > 1:
+        return __classifyParallel(paths, rulesets, processes, chunksize)
+    return __classify(paths, rulesets)
+def __classify(paths, rulesets):
+    items = [_split(path) for path in paths]
+    items.sort()
+
+    # stack of (folders, context, compiled, matches) from the root
+    context = folderContext(rulesets.get('', {}), {})
+    stack = [([], context, context.compiled(), 0)]
+    for names, isDir, path in items:
+        folders = names[:-1]
+        while not folders[0:len(stack[-1][0])] == stack[-1][0]:
+            stack.pop()
+        for i in range(len(stack[-1][0]), len(folders)):
+            name = folders[i]
+            parent = stack[-1]
+            matches = _matches(name, True, parent[2], parent[3])
+            context = folderContext(rulesets.get('/'.join(folders[0:i + 1]), {}), parent[1].sub(name))
+            stack.append((folders[0:i + 1], context, context.compiled(), matches))
+        top = stack[-1]
+        yield path, isDir, _matches(names[-1], isDir, top[2], top[3])
+
+# Worker process state (see classify)
+_shared = None
+def _initWorker(rulesets):
+    global _shared
+    _shared = rulesets
+def _classifyShard(paths):
+    # matches are sent as names, as bits are specific to each process
+    return [(path, isDir, list(matches)) for path, isDir, matches in __classify(paths, _shared)]
+
+# Yields lists of at most 'chunksize' paths, each of them holding a single top folder
+# the files of the root come first, and are shared in shards of their own
+def _shards(paths, chunksize):
+    items = [(len(names) > 1, names, path) for names, isDir, path in [_split(path) for path in paths]]
+    items.sort()
+    shard = []
+    top = None
+    for inFolder, names, path in items:
+        # None is the top of the root files
+        folder = names[0] if inFolder else None
+        if len(shard) > 0 and (not folder == top or len(shard) >= chunksize):
+            yield shard
+            shard = []
+        top = folder
+        shard.append(path)
+    if len(shard) > 0: yield shard
+
+def __classifyParallel(paths, rulesets, processes, chunksize):
+    # imported here, as it is slow to import and seldom used
+    import multiprocessing
+    pool = multiprocessing.Pool(processes, _initWorker, (rulesets,))
+    try:
+        for result in pool.imap(_classifyShard, _shards(paths, chunksize)):
+            for path, isDir, matches in result:
+                yield path, isDir, folderTree.toMatches(matches)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+# Raised for a path which is not below the root of a Checker
+class OutsideRoot(Exception):
+    pass
+
+# A Checker matches paths one by one (i.e. git check-ignore)
+# The rules files of a folder are read the first time one of its paths
+# is checked, the paths themselves are not required to exist
+# - root : the folder the paths are relative to
+# - filenames : rules files (ruleset name is the filename)
+# - folders : a Dictionnary of folder path ('' for the root)
+#             to its (context, compiled context, matches)
+# A path outside the root (i.e. '../x', or an absolute path elsewhere)
+# raises OutsideRoot
+class Checker:
+    def __init__(self, root, filenames = None):
+        self.root = root
+        self.filenames = ['.gitignore'] if filenames is None else filenames
+        self.folders = {}
+    def __folder(self, names):
+        key = '/'.join(names)
+        entry = self.folders.get(key)
+        if entry is None:
+            local = {}
+            for filename in self.filenames:
+                filepath = os.path.join(self.root, key, filename)
+                if os.path.isfile(filepath):
+                    rs = addRules.RuleSet().loadfromfile(filepath)
+                    if len(rs) > 0: local[filename] = rs
+            if len(names) == 0:
+                context = folderContext(local, {})
+                matches = 0
+            else:
+                parent = self.__folder(names[:-1])
+                matches = _matches(names[-1], True, parent[1], parent[2])
+                context = folderContext(local, parent[0].sub(names[-1]))
+            entry = self.folders[key] = (context, context.compiled(), matches)
+        return entry
+    def __split(self, path, isDir):
+        root = os.path.abspath(self.root)
+        relpath = os.path.relpath(os.path.join(root, path), root)
+        if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+            raise OutsideRoot("'%s' is outside the root '%s'" % (path, self.root))
+        if relpath == os.curdir: relpath = ''
+        names, slash, unused = _split(relpath + ('/' if path.endswith('/') else ''))
+        names = [name for name in names if name]
+        if isDir is None:
+            isDir = slash or os.path.isdir(os.path.join(self.root, relpath))
+        return names, isDir
+    # Returns the Matches of a path
+    # - path : relative to the root, or absolute
+    # - isDir : if None, a path ending with '/' or an existing folder is a folder
+    def check(self, path, isDir = None):
+        names, isDir = self.__split(path, isDir)
+        if len(names) == 0: return folderTree.Matches(0)
+        folder = self.__folder(names[:-1])
+        return _matches(names[-1], isDir, folder[1], folder[2])
+    # Returns the (ruleset name, Rule) which makes a path ignored (or None)
+    # i.e. the rule matching the path, or its first ignored parent folder
+    def rule(self, path, isDir = None):
+        names, isDir = self.__split(path, isDir)
+        for i in range(0, len(names)):
+            folder = self.__folder(names[0:i])
+            for bit, crs in folder[1]:
+                itemIsDir = isDir if i == len(names) - 1 else True
+                if crs.match(names[i], itemIsDir):
+                    return list(folderTree.Matches(bit))[0], crs.matchingRule(names[i], itemIsDir)
+        return None
 
 if __name__ == "__main__":
     tree = folderTree.get('test')
     addRules.addFromFile(tree, '.gitignore')
     apply(tree)
-    #print tree
+    print tree
+    full = folderTree.tolist(tree, ['!.gitignore'])
+    tree = walk('test')
+    print tree
+    pruned = folderTree.tolist(tree, ['!.gitignore'])
+    if not sorted(full) == sorted(pruned): raise Exception('walk and apply differ')
+    paths = [item[0] for item in iterpaths('test', None, ['!.gitignore'])]
+    if not sorted(full) == sorted(paths): raise Exception('iterpaths and apply differ')
+    rulesets = {'': {'rs': addRules.RuleSet([addRules.Rule('*.c'), addRules.Rule('f9/')])}}
+    for path, isDir, matches in classify(['sub3/f1.c', 'sub1/f9/foo', 'sub1/f9/', 'sub1/f4/foo', 'sub2/'], rulesets):
+        if not ('rs' in matches) == (path in ['sub3/f1.c', 'sub1/f9/foo', 'sub1/f9/']): raise Exception(path)
+    paths = [path + ('/' if isDir else '') for path, isDir, matches in iterpaths('test')]
+    if not sorted(classify(paths, rulesets)) == sorted(classify(paths, rulesets, 2, 3)): raise Exception('processes')
+    shards = list(_shards(['b', 'sub/x', 'a', 'sub/y', 'c/', 'd', 'e', 'sub/z'], 3))
+    if not shards == [['a', 'b', 'c/'], ['d', 'e'], ['sub/x', 'sub/y', 'sub/z']]: raise Exception(shards)
+    import shutil
+    import tempfile
+    root = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(root, 'src'))
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\nbuild/\n')
+        open(os.path.join(root, 'src', '.gitignore'), 'wb').write('!keep.o\n')
+        os.mkdir(os.path.join(root, 'logs'))
+        open(os.path.join(root, 'logs', 'important.log'), 'wb').write('')
+        open(os.path.join(root, 'logs', '.gitignore'), 'wb').write('*.log\n')
+        open(os.path.join(root, '.gitignore'), 'ab').write('*.log\n!important.log\n*.log\n')
+        for path in ['important.log', 'logs/important.log']:
+            if not '.gitignore' in Checker(root).check(path): raise Exception('last rule wins: ' + path)
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\nbuild/\n*.log\n!important.log\n')
+        if not '.gitignore' in Checker(root).check('logs/important.log'): raise Exception('the child rule wins')
+        if '.gitignore' in Checker(root).check('important.log'): raise Exception('!important.log')
+        if not '.gitignore' in walk(root).first().content['logs'].content['important.log'].matches: raise Exception('walk: the child rule wins')
+        os.remove(os.path.join(root, 'logs', 'important.log'))
+        checker = Checker(root)
+        for path, ignored in [('a.o', True), ('src/a.o', True), ('src/keep.o', False), ('src/a.c', False), ('build/', True), ('build/x/y.c', True), ('build', False), (os.path.join(root, 'src', 'b.o'), True)]:
+            if not ('.gitignore' in checker.check(path)) == ignored: raise Exception(path)
+        if not checker.rule('build/x/y.c')[1].pattern == 'build/': raise Exception('rule of a parent folder')
+        if not checker.rule('src/a.o')[1].pattern == '*.o': raise Exception('rule')
+        if not checker.rule('src/keep.o') is None: raise Exception('negated rule')
+        if not sorted(checker.folders) == ['', 'build', 'build/x', 'src']: raise Exception('folders')
+        if not checker.check(os.path.join(root, 'src', '..', 'build', 'x')) == checker.check('build/x'): raise Exception('absolute path')
+        for path in ['../y.c', 'src/../../y.c', os.path.join(os.path.dirname(root), 'x.o'), '/etc/x.o']:
+            try:
+                checker.check(path)
+                raise Exception('outside the root: ' + path)
+            except OutsideRoot:
+                pass
+        os.makedirs(os.path.join(root, 'build', 'sub'))
+        open(os.path.join(root, 'build', 'a.c'), 'wb').write('')
+        tree = walk(root)
+        if not len(tree.first().content['build'].content) == 0: raise Exception('pruned')
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\n')
+        update(tree, [os.path.join(root, '.gitignore')])
+        if not sorted(folderTree.tolist(tree)) == sorted(folderTree.tolist(walk(root))): raise Exception('not pruned anymore')
+        if not 'a.c' in tree.first().content['build'].content: raise Exception('build is listed')
+        before = {'.gitignore': addRules.RuleSet([addRules.Rule('!abc')])}
+        after = {'.gitignore': addRules.RuleSet([addRules.Rule('abc', False, True)])}
+        if not _differ(before, after): raise Exception('literal and negated rules differ')
+    finally:
+        shutil.rmtree(root)
+    print ""
+    print "utests ends with success"
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+import os
+import Queue
+import threading
+import folderTree
+import applyRules
+
+# Rules are applied by one thread at a time, whatever the count of Scan
+# (the caches of compileRules, ruleContext... are not thread safe)
+_lock = threading.Lock()
+
+# A Scan lists a folder content in background threads, with rules applied
+# (a non blocking version of applyRules.iterpaths)
+# The results are batches of (path, isDir, matches), in no particular order
+# - rulesets : rules files to read while entering a folder (ruleset name is the filename)
+# - filters : see folderTree.tolist, a filtered out folder is not listed
+# - workers : count of folders listed at once
+# - batchsize : count of results gathered before a batch is available
+# An event loop waits for batches on fileno() (i.e. select, or add_reader),
+# then gets them with results(False)
+# Folders are listed concurrently, while the rules are applied by one thread at a time (see _lock)
+# note: the batches are posted without the lock held, so a worker blocked on
+# the pipe (i.e. a full pipe, the event loop being late) doesn't block the others
+class Scan:
+    def __init__(self, path, rulesets = None, filters = None, workers = 4, batchsize = 1000):
+        self.path = path
+        self.rulesets = ['.gitignore'] if rulesets is None else rulesets
+        self.filters = applyRules.compileFilters(self.rulesets, filters)
+        self.workers = workers
+        self.batchsize = batchsize
+        self.cancelled = False
+        self.error = None
+        self.done = False
+        self.closing = False
+        self.closed = False
+        self.tasks = Queue.Queue()
+        self.batches = Queue.Queue()
+        self.batch = []
+        self.pending = 0
+        self.reader, self.writer = os.pipe()
+    # Starts the background threads
+    def start(self):
+        self.pending = 1
+        self.tasks.put((applyRules.roottask(self.path), ''))
+        for i in range(0, self.workers):
+            worker = threading.Thread(target=self.__work)
+            worker.daemon = True
+            worker.start()
+        return self
+    # Stops the scan: the folders not listed yet are dropped
+    # (the end of the results still comes through results())
+    def cancel(self):
+        self.cancelled = True
+    # A file descriptor which is readable when a batch is available
+    def fileno(self):
+        return self.reader
+    # Returns the next batch (a list), or None once the scan is over
+    # - block : if False, raises Queue.Empty when no batch is available
+    def results(self, block = True, timeout = None):
+        batch = self.batches.get(block, timeout)
+        os.read(self.reader, 1)
+        if batch is None:
+            self.batches.put(None)
+            os.write(self.writer, '.')
+            if not self.error is None: raise self.error
+        return batch
+    def __iter__(self):
+        while True:
+            batch = self.results()
+            if batch is None: return
+            for item in batch:
+                yield item
+    # Releases the file descriptors
+    # a scan which is not over is cancelled, and they are released once it is
+    # (i.e. once the workers don't write to them anymore)
+    # note: once released, closing again does nothing (the fds may be reused)
+    def close(self):
+        with _lock:
+            if not self.done:
+                self.cancelled = True
+                self.closing = True
+                return
+        self.__close()
+    def __close(self):
+        with _lock:
+            if self.closed: return
+            self.closed = True
+        os.close(self.reader)
+        os.close(self.writer)
+    def __work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None: return
+            try:
+                if not self.cancelled: self.__folder(*task)
+            except Exception as e:
+                if self.error is None: self.error = e
+                self.cancelled = True
+            with _lock:
+                self.pending = self.pending - 1
+                last = self.pending == 0
+            if last: self.__finish()
+    def __folder(self, task, base):
+        # listed without the lock held (see applyRules.iterfolder)
+        items = list(folderTree.scan(task[0]))
+        subfolders = []
+        batch = None
+        with _lock:
+            for key, isdir, matches, subtask in applyRules.iterfolder(task, self.rulesets, self.filters, items):
+                newbase = os.path.join(base, key)
+                self.batch.append((newbase, isdir, matches))
+                if isdir:
+                    subfolders.append((subtask, newbase))
+            if len(self.batch) >= self.batchsize:
+                batch = self.batch
+                self.batch = []
+            self.pending = self.pending + len(subfolders)
+        if not batch is None: self.__post(batch)
+        for task in subfolders:
+            self.tasks.put(task)
+    def __post(self, batch):
+        self.batches.put(batch)
+        os.write(self.writer, '.')
+    # called by the last worker, once every folder is done
+    # (so that the end of the results comes after every batch)
+    def __finish(self):
+        if len(self.batch) > 0: self.__post(self.batch)
+        self.batch = []
+        self.__post(None)
+        for i in range(0, self.workers):
+            self.tasks.put(None)
+        with _lock:
+            self.done = True
+            closing = self.closing
+        if closing: self.__close()
+
+# Returns a started Scan (see Scan)
+def scan(path, rulesets = None, filters = None, workers = 4, batchsize = 1000):
+    return Scan(path, rulesets, filters, workers, batchsize).start()
+
+#Unitary Tests
+if __name__ == "__main__":
+    import time
+    import select
+    import shutil
+    import tempfile
+    root = tempfile.mkdtemp()
+    try:
+        for i in range(0, 5):
+            os.makedirs(os.path.join(root, 'dir%d' % i, 'sub'))
+            for name in ['a.c', 'a.o', 'sub/b.c']:
+                open(os.path.join(root, 'dir%d' % i, name), 'wb').close()
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\n')
+        expected = sorted(applyRules.iterpaths(root, None, ['!.gitignore']))
+        s = scan(root, None, ['!.gitignore'], 3, 4)
+        out = []
+        while True:
+            readable, unused, unused = select.select([s], [], [], 5)
+            if not readable: raise Exception('timeout')
+            batch = s.results(False)
+            if batch is None: break
+            if len(batch) == 0: raise Exception('empty batch')
+            out = out + batch
+        s.close()
+        s.close()
+        if not sorted(out) == expected: raise Exception('scan and iterpaths differ')
+        if not sorted(scan(root, None, ['!.gitignore'])) == expected: raise Exception('iteration')
+        s = Scan(root, None, None, 1)
+        s.cancel()
+        if not list(s.start()) == [] or not s.done: raise Exception('cancel')
+        s.close()
+        s = scan(root, None, None, 1, 1)
+        s.close()
+        deadline = time.time() + 5
+        while True:
+            try:
+                os.fstat(s.reader)
+            except OSError:
+                break
+            if time.time() > deadline: raise Exception('not released')
+            time.sleep(0.01)
+        if not s.done: raise Exception('released before the end')
+        reader, writer = os.pipe()
+        s.close()
+        os.write(writer, '.')
+        os.close(reader)
+        os.close(writer)
+        s = scan(os.path.join(root, 'missing'))
+        try:
+            list(s)
+            raise Exception('no error')
+        except OSError:
+            pass
+    finally:
+        shutil.rmtree(root)
+    print ""
+    print "utests ends with success"
@@ -0,0 +1,171 @@
+#!/usr/bin/python
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import folderTree
+import addRules
+import applyRules
+import ruleContext
+
+# Some rules taken from the usual .gitignore templates (C, Python, Node, Java...)
+TEMPLATE_RULES = [
+    '*.o', '*.a', '*.so', '*.obj', '*.exe', '*.dll', '*.lib', '*.d',
+    '*.py[cod]', '__pycache__/', '*.egg-info/', '.eggs/', 'dist/', 'build/',
+    '.tox/', '.venv/', '.pytest_cache/', '.mypy_cache/', '.coverage',
+    'node_modules/', 'npm-debug.log*', 'yarn-error.log*', '.npm/', 'coverage/',
+    '*.class', '*.jar', '*.war', 'target/', '.gradle/', 'out/',
+    '.DS_Store', 'Thumbs.db', '*.swp', '*~', '.idea/', '.vscode/', '*.log', '*.tmp',
+    '/config/local.*', 'docs/_build/', '**/generated/', 'logs/**',
+]
+
+# Rules which are known to be expensive
+PATHOLOGICAL_RULES = [
+    '**/a*/**/b*/**', '**/*a*b*c*', '**/[a-z]*[0-9]/**', '*?*?*?*?*?*x',
+    '**/**/**/deep', 'a/**/b/**/c/**/d', '**/[!a-m]*.[ch]', '*[0-9][0-9][0-9]*',
+]
+
+EXTENSIONS = ['c', 'h', 'o', 'py', 'pyc', 'js', 'json', 'md', 'txt', 'log', 'class', 'so']
+
+# Returns a list of rules
+# - kind : 'template', 'pathological' or 'literal'
+# - count : rules count (generated rules are added beyond the corpus size)
+def generateRules(kind, count, seed = 0):
+    rnd = random.Random(seed)
+    out = []
+    corpus = PATHOLOGICAL_RULES if kind == 'pathological' else TEMPLATE_RULES
+    if kind == 'literal': corpus = []
+    out = list(corpus[0:count])
+    while len(out) < count:
+        n = len(out)
+        if kind == 'pathological':
+            out.append('**/%s*%d*/**/*.%s' % (rnd.choice('abcdef'), n, rnd.choice(EXTENSIONS)))
+        elif n % 3 == 0:
+            out.append('*.gen%d' % n)
+        elif n % 3 == 1:
+            out.append('name%d' % n)
+        else:
+            out.append('/services/svc%d/dist/' % n)
+    return out
+
+# Creates a synthetic tree in 'root' and returns its items count
+# - root : an empty or missing folder
+# - depth/fanout : folders depth and sub folders count per folder
+# - files : files count per folder
+# - hotspots : count of 'node_modules' like folders (fanout * 10 folders of 'files' files)
+# - rules : rules of the root .gitignore (a nested .gitignore is added every 'fanout' folders)
+def generateTree(root, depth = 4, fanout = 4, files = 10, hotspots = 1, rules = None, seed = 0):
+    rnd = random.Random(seed)
+    rules = [] if rules is None else rules
+    count = [0]
+    folders = []
+    def touch(path):
+        open(path, 'wb').close()
+        count[0] = count[0] + 1
+    def fill(path, level):
+        folders.append(path)
+        for i in range(0, files):
+            touch(os.path.join(path, 'file%d.%s' % (i, rnd.choice(EXTENSIONS))))
+        if level >= depth: return
+        for i in range(0, fanout):
+            sub = os.path.join(path, 'dir%d' % i)
+            os.mkdir(sub)
+            count[0] = count[0] + 1
+            fill(sub, level + 1)
+    if not os.path.isdir(root): os.makedirs(root)
+    elif len(os.listdir(root)) > 0: raise Exception('the root is not empty: ' + root)
+    fill(root, 0)
+    for i in range(0, hotspots):
+        hotspot = os.path.join(rnd.choice(folders), 'node_modules')
+        if os.path.exists(hotspot): continue
+        os.mkdir(hotspot)
+        for j in range(0, fanout * 10):
+            sub = os.path.join(hotspot, 'package%d' % j)
+            os.mkdir(sub)
+            for k in range(0, files):
+                touch(os.path.join(sub, 'index%d.js' % k))
+    f = open(os.path.join(root, '.gitignore'), 'wb')
+    f.write('\n'.join(rules) + '\n')
+    f.close()
+    for i in range(fanout, len(folders), fanout):
+        f = open(os.path.join(folders[i], '.gitignore'), 'wb')
+        f.write('\n'.join(rnd.sample(rules, min(3, len(rules)))) + '\n')
+        f.close()
+    return count[0]
+
+# Returns the best (min) duration of a call over 'repeat' runs and its last result
+# - setup : called before every run (not timed), its result is given to the call
+# - cold : if True, every run starts without the process memos (see ruleContext.clear)
+def _time(repeat, call, setup = None, cold = True):
+    best = None
+    result = None
+    for i in range(0, repeat):
+        if cold: ruleContext.clear()
+        arg = None if setup is None else setup()
+        start = time.time()
+        result = call(arg)
+        duration = time.time() - start
+        if best is None or duration < best: best = duration
+    return best, result
+
+# Runs every phase on a tree and returns the timings (seconds)
+# Every phase is timed cold, i.e. rules are parsed, compiled and matched again,
+# 'warm' holds the timings of the matching phases with the memos of the previous runs
+def run(root, repeat = 3):
+    out = {}
+    def load(tree):
+        addRules.addFromFile(tree, '.gitignore')
+        return tree
+    def match(tree):
+        applyRules.apply(tree)
+        return tree
+    out['walk'], unused = _time(repeat, lambda unused: folderTree.get(root))
+    out['load'], unused = _time(repeat, load, lambda: folderTree.get(root))
+    out['match'], tree = _time(repeat, match, lambda: load(folderTree.get(root)))
+    out['tolist'], paths = _time(repeat, lambda unused: folderTree.tolist(tree, ['!.gitignore']))
+    out['singlepass'], unused = _time(repeat, lambda unused: applyRules.walk(root))
+    out['listed'] = len(paths)
+    out['warm'] = {}
+    out['warm']['match'], unused = _time(repeat, match, lambda: tree, False)
+    out['warm']['singlepass'], unused = _time(repeat, lambda unused: applyRules.walk(root), None, False)
+    return out
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='gitIgnorePython benchmarks')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--hotspots', type=int, default=1)
+    parser.add_argument('--rules', type=int, default=50)
+    parser.add_argument('--kind', choices=['template', 'literal', 'pathological'], default='template')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--root', help='where to generate the tree, an empty or missing folder (default: a temporary folder)')
+    parser.add_argument('-o', '--output', help='json output file (default: stdout)')
+    args = parser.parse_args()
+    if args.root and os.path.isdir(args.root) and len(os.listdir(args.root)) > 0:
+        parser.error('--root must be an empty or missing folder: ' + args.root)
+
+    root = args.root if args.root else tempfile.mkdtemp()
+    try:
+        rules = generateRules(args.kind, args.rules, args.seed)
+        items = generateTree(root, args.depth, args.fanout, args.files, args.hotspots, rules, args.seed)
+        result = {
+            'params': vars(args),
+            'items': items,
+            'python': sys.version.split()[0],
+            'timings': run(root, args.repeat),
+        }
+    finally:
+        if not args.root: shutil.rmtree(root)
+    s = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        f = open(args.output, 'wb')
+        f.write(s + '\n')
+        f.close()
+    else:
+        print s
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+import os
+import heapq
+import tempfile
+import folderTree
+import applyRules
+
+# Yields (path, isDir, matches) for every item below 'path' (see applyRules.iterpaths)
+# Folders are walked depth first with an explicit stack instead of a recursion,
+# so the tree depth is not limited, and only one folder listing is held at once
+# note: the whole content of a folder comes before the content of its sub folders
+def iterpaths(path, rulesets = None, filters = None):
+    rulesets = ['.gitignore'] if rulesets is None else rulesets
+    filters = applyRules.compileFilters(rulesets, filters)
+    # stack of (task, relative path), see applyRules.iterfolder
+    stack = [(applyRules.roottask(path), '')]
+    while len(stack) > 0:
+        task, base = stack.pop()
+        subfolders = []
+        for key, isdir, matches, subtask in applyRules.iterfolder(task, rulesets, filters):
+            newbase = os.path.join(base, key)
+            yield newbase, isdir, matches
+            if isdir:
+                subfolders.append((subtask, newbase))
+        # reversed, so that sub folders are walked in the listing order
+        subfolders.reverse()
+        stack.extend(subfolders)
+
+# Approximate memory cost of a result, besides its path
+_OVERHEAD = 120
+
+# Results is an append only list of (path, isDir, matches)
+# held in memory up to a budget, then spilled to a temporary file
+# - budget : approximate memory budget (bytes)
+# - sort : if True, results are iterated sorted by path
+#          every spilled run is sorted, and runs are merged while iterating
+# - folder : where the temporary file is created (default: tempfile default)
+# A spilled result is written as: path NUL flags+matches (hex) NUL
+class Results:
+    def __init__(self, budget = 64 * 1024 * 1024, sort = False, folder = None):
+        self.budget = budget
+        self.sort = sort
+        self.folder = folder
+        self.buffer = []
+        self.size = 0
+        self.count = 0
+        self.file = None
+        self.filepath = None
+        # spilled runs, a list of (start offset, end offset)
+        self.runs = []
+    def __len__(self):
+        return self.count
+    def append(self, path, isDir, matches):
+        self.buffer.append((path, isDir, int(matches)))
+        self.size = self.size + len(path) + _OVERHEAD
+        self.count = self.count + 1
+        if self.size > self.budget: self.spill()
+    # Writes the results held in memory to the temporary file
+    def spill(self):
+        if len(self.buffer) == 0: return
+        if self.file is None:
+            fd, self.filepath = tempfile.mkstemp('', '.results.', self.folder)
+            self.file = os.fdopen(fd, 'ab')
+        if self.sort: self.buffer.sort()
+        start = self.file.tell()
+        write = self.file.write
+        for path, isDir, matches in self.buffer:
+            write('%s\0%x\0' % (path, (matches << 1) | int(isDir)))
+        self.file.flush()
+        self.runs.append((start, self.file.tell()))
+        self.buffer = []
+        self.size = 0
+    def __run(self, start, end):
+        f = open(self.filepath, 'rb')
+        try:
+            f.seek(start)
+            remaining = end - start
+            pending = ''
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1024 * 1024))
+                if not chunk: break
+                remaining = remaining - len(chunk)
+                fields = (pending + chunk).split('\0')
+                pending = fields.pop()
+                if len(fields) % 2 == 1: pending = fields.pop() + '\0' + pending
+                for i in range(0, len(fields), 2):
+                    value = int(fields[i + 1], 16)
+                    yield fields[i], value & 1 == 1, value >> 1
+        finally:
+            f.close()
+    # Yields (path, isDir, matches), the spilled ones first (unless sorted)
+    def __iter__(self):
+        runs = [self.__run(start, end) for start, end in self.runs]
+        if self.sort:
+            items = heapq.merge(*(runs + [iter(sorted(self.buffer))]))
+        else:
+            items = (item for run in runs + [iter(self.buffer)] for item in run)
+        for path, isDir, matches in items:
+            yield path, isDir, folderTree.Matches(matches)
+    # Removes the temporary file
+    def close(self):
+        if self.file is None: return
+        self.file.close()
+        os.remove(self.filepath)
+        self.file = None
+        self.runs = []
+
+# Returns the Results of a walk (see iterpaths and Results)
+def walk(path, rulesets = None, filters = None, budget = 64 * 1024 * 1024, sort = False, folder = None):
+    out = Results(budget, sort, folder)
+    for itempath, isDir, matches in iterpaths(path, rulesets, filters):
+        out.append(itempath, isDir, matches)
+    return out
+
+#Unitary Tests
+if __name__ == "__main__":
+    import sys
+    import shutil
+    rulesets = ['foo', 'bar']
+    expected = list(iterpaths('test', rulesets, ['!foo']))
+    if not sorted(expected) == sorted(applyRules.iterpaths('test', rulesets, ['!foo'])): raise Exception('iterpaths')
+    results = walk('test', rulesets, ['!foo'], 500)
+    if not len(results.runs) > 1: raise Exception('not spilled')
+    if not (list(results) == expected and len(results) == len(expected)): raise Exception('spilled results')
+    results.close()
+    results = walk('test', rulesets, ['!foo'], 500, True)
+    if not list(results) == sorted(expected): raise Exception('sorted results')
+    if not os.path.exists(results.filepath): raise Exception('spill file')
+    results.close()
+    if os.path.exists(results.filepath): raise Exception('close')
+    root = tempfile.mkdtemp()
+    try:
+        deep = root
+        for i in range(0, sys.getrecursionlimit() + 10):
+            deep = os.path.join(deep, 'd')
+            os.mkdir(deep)
+        if not len(list(iterpaths(os.path.join(root, 'd')))) == sys.getrecursionlimit() + 9: raise Exception('deep tree')
+        while not deep == root:
+            os.rmdir(deep)
+            deep = os.path.dirname(deep)
+    finally:
+        shutil.rmtree(root)
+    print ""
+    print "utests ends with success"
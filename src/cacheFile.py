@@ -0,0 +1,119 @@
+#!/usr/bin/python
+import os
+import time
+import atexit
+import tempfile
+import threading
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Returns the default path of a cache file
+# i.e. $XDG_CACHE_HOME/gitIgnorePython/<filename>
+def defaultPath(filename):
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'gitIgnorePython', filename)
+
+# Returns True if a modification time is too recent to be trusted
+# i.e. in the last second, as a second modification may keep the same stamp
+def recent(mtime):
+    return mtime >= time.time() - 1
+
+# A CacheFile is the persistence of a cache (see ruleCache, dirCache)
+# i.e. a Dictionnary pickled to a file, loaded on first use (see entries)
+# - path : the cache file
+# - version : bumped whenever the entries content changes, so that old caches are dropped
+# - filename : the cache file name in the default folder (see defaultPath)
+# - dirty : set when the entries have changed, to be saved
+# - lock : held by the subclasses while they read or change the entries
+#          (a cache may be used by several threads, i.e. folderTree.get workers)
+class CacheFile:
+    version = 0
+    filename = 'cache'
+    def __init__(self, path = None):
+        self.path = defaultPath(self.filename) if path is None else path
+        self.__entries = None
+        self.dirty = False
+        self.lock = threading.RLock()
+    # Returns the Dictionnary of entries (empty if the file is missing, invalid or outdated)
+    def entries(self):
+        with self.lock:
+            return self.__load()
+    def __load(self):
+        if self.__entries is None:
+            self.__entries = {}
+            try:
+                f = open(self.path, 'rb')
+                try:
+                    data = pickle.load(f)
+                finally:
+                    f.close()
+                if data['version'] == self.version: self.__entries = data['entries']
+            except Exception:
+                pass
+        return self.__entries
+    # Writes the cache file (only if something has changed)
+    # it is written to a temporary file first, so that it is never read partially written
+    def save(self):
+        with self.lock:
+            self.__save()
+    def __save(self):
+        if not self.dirty: return
+        folder = os.path.dirname(self.path)
+        if not os.path.isdir(folder): os.makedirs(folder)
+        fd, tmp = tempfile.mkstemp('', '.' + self.filename + '.', folder)
+        f = os.fdopen(fd, 'wb')
+        try:
+            pickle.dump({'version': self.version, 'entries': self.entries()}, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmp, self.path)
+        self.dirty = False
+
+# A Current holds the cache in use of a kind (or None if disabled)
+# the cache is saved when it is replaced, and at exit
+# - factory : builds a cache from its path (i.e. a CacheFile class)
+class Current:
+    def __init__(self, factory):
+        self.factory = factory
+        self.cache = None
+        atexit.register(self.disable)
+    def get(self):
+        return self.cache
+    def enable(self, path = None):
+        self.disable()
+        self.cache = self.factory(path)
+        return self.cache
+    def disable(self):
+        if not self.cache is None: self.cache.save()
+        self.cache = None
+
+#Unitary Tests
+if __name__ == "__main__":
+    import shutil
+    class _Cache(CacheFile):
+        version = 3
+        filename = 'test.cache'
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'sub', 'test.cache')
+        current = Current(_Cache)
+        cache = current.enable(path)
+        if not (current.get() is cache and cache.entries() == {}): raise Exception('empty cache')
+        cache.entries()['a'] = 1
+        cache.save()
+        if os.path.exists(path): raise Exception('saved while not dirty')
+        cache.dirty = True
+        current.disable()
+        if not (current.get() is None and os.path.exists(path)): raise Exception('disable')
+        if not _Cache(path).entries() == {'a': 1}: raise Exception('load')
+        _Cache.version = 4
+        if not _Cache(path).entries() == {}: raise Exception('outdated version')
+        if not os.listdir(os.path.dirname(path)) == ['test.cache']: raise Exception('temporary file')
+        if not (recent(time.time()) and not recent(time.time() - 10)): raise Exception('recent')
+        if not defaultPath('x.cache').endswith(os.path.join('gitIgnorePython', 'x.cache')): raise Exception('defaultPath')
+    finally:
+        shutil.rmtree(folder)
+    print ""
+    print "utests ends with success"
@@ -0,0 +1,336 @@
+#!/usr/bin/python
+import os
+import mmap
+import struct
+from array import array
+import folderTree
+import applyRules
+
+NONE = -1
+
+# A CompactTree stores a whole tree in parallel arrays
+# (one entry per item, index 0 is the root folder)
+# - parents : parent item index
+# - names : name id, in the 'strings' table (names are stored once)
+# - types : folderTree.FILE or folderTree.FOLDER
+# - masks : matches bitmask (see folderTree.Matches)
+# - children/siblings : first child / next sibling index (or NONE)
+# It provides the Tree API (as folderTree.get), items being lightweight views
+class CompactTree(object):
+    def __init__(self):
+        self.parents = array('l')
+        self.names = array('l')
+        self.types = array('b')
+        self.masks = array('L')
+        self.children = array('l')
+        self.siblings = array('l')
+        self.strings = []
+        self.__lasts = {}
+        self.__stringIds = {}
+    def __intern(self, s):
+        id = self.__stringIds.get(s)
+        if id is None:
+            id = len(self.strings)
+            self.strings.append(s)
+            self.__stringIds[s] = id
+        return id
+    # Returns the bitmask of a list of ruleset names
+    def mask(self, matches):
+        return int(folderTree.toMatches(matches))
+    # Returns the ruleset names of a bitmask
+    def matches(self, mask):
+        return folderTree.Matches(mask)
+    # Adds an item, and returns its index
+    def append(self, parent, name, type, matches = None):
+        index = len(self.types)
+        self.parents.append(parent)
+        self.names.append(self.__intern(name))
+        self.types.append(type)
+        mask = self.mask([] if matches is None else matches)
+        try:
+            self.masks.append(mask)
+        except OverflowError:
+            # beyond 64 ruleset names, masks don't fit in an array anymore
+            self.masks = list(self.masks)
+            self.masks.append(mask)
+        self.children.append(NONE)
+        self.siblings.append(NONE)
+        if parent <> NONE:
+            last = self.__lasts.get(parent)
+            if last is None:
+                self.children[parent] = index
+            else:
+                self.siblings[last] = index
+            self.__lasts[parent] = index
+        return index
+    # Must be called once the tree is complete
+    def close(self):
+        self.__lasts = {}
+        self.__stringIds = {}
+        return self
+    # Returns the relative path of an item
+    def path(self, index):
+        out = []
+        while index > 0:
+            out.append(self.strings[self.names[index]])
+            index = self.parents[index]
+        return '/'.join(reversed(out))
+    # Tree API
+    def __str__(self):
+        return folderTree.render(self)
+    def __iter__(self):
+        if len(self.types) > 0: yield self.strings[self.names[0]]
+    def __getitem__(self, i):
+        if len(self.types) == 0 or not self.strings[self.names[0]] == i: raise KeyError(i)
+        return _ItemView(self, 0)
+    def __len__(self):
+        return 1 if len(self.types) > 0 else 0
+    def first(self):
+        return _ItemView(self, 0) if len(self.types) > 0 else None
+
+# A view on an item of a CompactTree (FileItem/FolderItem API)
+class _ItemView(object):
+    __slots__ = ('tree', 'index')
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+    @property
+    def type(self):
+        return self.tree.types[self.index]
+    @property
+    def matches(self):
+        return self.tree.matches(self.tree.masks[self.index])
+    @property
+    def content(self):
+        return _ContentView(self.tree, self.index)
+    @property
+    def stat(self):
+        return None
+    @property
+    def rulesets(self):
+        return {}
+    def __str__(self):
+        matches = self.matches
+        if len(matches) == 0: return ''
+        return 'matches: [' + ', '.join(matches) + ']'
+
+# A view on a folder content of a CompactTree (Tree API)
+class _ContentView(object):
+    __slots__ = ('tree', 'index', 'keys')
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+        self.keys = None
+    def __indexes(self):
+        tree = self.tree
+        child = tree.children[self.index]
+        while child <> NONE:
+            yield child
+            child = tree.siblings[child]
+    def __str__(self):
+        return folderTree.render(self)
+    def __iter__(self):
+        for child in self.__indexes():
+            yield self.tree.strings[self.tree.names[child]]
+    def __getitem__(self, i):
+        if self.keys is None:
+            self.keys = {}
+            for child in self.__indexes():
+                self.keys[self.tree.strings[self.tree.names[child]]] = child
+        return _ItemView(self.tree, self.keys[i])
+    def __len__(self):
+        count = 0
+        for child in self.__indexes():
+            count = count + 1
+        return count
+    def first(self):
+        for child in self.__indexes():
+            return _ItemView(self.tree, child)
+        return None
+
+# Returns a CompactTree from a Tree (see folderTree.get)
+def fromTree(tree):
+    out = CompactTree()
+    for key in tree:
+        value = tree[key]
+        index = out.append(NONE, key, value.type, value.matches)
+        __fromTree(out, value.content, index)
+    return out.close()
+def __fromTree(out, tree, parent):
+    for key in tree:
+        value = tree[key]
+        index = out.append(parent, key, value.type, value.matches)
+        if value.type == folderTree.FOLDER:
+            __fromTree(out, value.content, index)
+
+# Returns a new CompactTree based on a folder content, with rules applied
+# (see applyRules.iterpaths for rulesets and filters)
+def get(path, rulesets = None, filters = None):
+    out = CompactTree()
+    indexes = {'': out.append(NONE, path, folderTree.FOLDER)}
+    for itempath, isDir, matches in applyRules.iterpaths(path, rulesets, filters):
+        parent, name = os.path.split(itempath)
+        index = out.append(indexes[parent], name, folderTree.FOLDER if isDir else folderTree.FILE, matches)
+        if isDir: indexes[itempath] = index
+    return out.close()
+
+# Snapshot file layout (little endian)
+# - header : magic, version, items count, strings count, bits count,
+#            then the offset of every following section
+# - parents, names, children, siblings : int32 per item
+# - types : int8 per item
+# - masks : uint64 per item
+# - offsets : uint32 per string, plus the end offset
+# - strings : every string, back to back
+# - bits : int32 string id per bit (the ruleset names)
+MAGIC = 'GITIGN\0\0'
+VERSION = 1
+_HEADER = struct.Struct('<8sIIII9Q')
+_CHUNK = 65536
+
+def _pack(f, fmt, values):
+    for i in range(0, len(values), _CHUNK):
+        chunk = values[i:i + _CHUNK]
+        f.write(struct.pack('<%d%s' % (len(chunk), fmt), *chunk))
+
+def _align(f):
+    f.write('\0' * (-f.tell() % 8))
+    return f.tell()
+
+# Writes a tree (a Tree or a CompactTree) in a binary snapshot file
+def save(tree, path):
+    if not isinstance(tree, CompactTree): tree = fromTree(tree)
+    strings = [s.encode('utf-8') if isinstance(s, unicode) else s for s in tree.strings]
+    bits = []
+    mask = 0
+    for value in tree.masks: mask = mask | value
+    for name in folderTree.Matches(mask):
+        bits.append(len(strings))
+        strings.append(name.encode('utf-8') if isinstance(name, unicode) else name)
+    if len(bits) > 64: raise Exception('too many RuleSet names in a snapshot !')
+    bitIds = [folderTree.bit(strings[id]) for id in bits]
+    masks = []
+    for value in tree.masks:
+        out = 0
+        for i in range(0, len(bitIds)):
+            if value & bitIds[i]: out = out | (1 << i)
+        masks.append(out)
+    offsets = [0]
+    for s in strings: offsets.append(offsets[-1] + len(s))
+
+    f = open(path, 'wb')
+    try:
+        f.write('\0' * _HEADER.size)
+        sections = []
+        for fmt, values in [('i', tree.parents), ('i', tree.names), ('i', tree.children), ('i', tree.siblings), ('b', tree.types), ('Q', masks), ('I', offsets)]:
+            sections.append(_align(f))
+            _pack(f, fmt, values)
+        sections.append(_align(f))
+        f.write(''.join(strings))
+        sections.append(_align(f))
+        _pack(f, 'i', bits)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, len(tree.types), len(strings), len(bits), *sections))
+    finally:
+        f.close()
+
+# A read only array stored in a buffer
+class _MappedArray(object):
+    __slots__ = ('buffer', 'offset', 'struct', 'count')
+    def __init__(self, buffer, offset, fmt, count):
+        self.buffer = buffer
+        self.offset = offset
+        self.struct = struct.Struct('<' + fmt)
+        self.count = count
+    def __len__(self):
+        return self.count
+    def __getitem__(self, i):
+        if i < 0 or i >= self.count: raise IndexError(i)
+        return self.struct.unpack_from(self.buffer, self.offset + i * self.struct.size)[0]
+    def __iter__(self):
+        for i in range(0, self.count):
+            yield self[i]
+
+# A read only strings table stored in a buffer
+class _MappedStrings(object):
+    __slots__ = ('buffer', 'offsets', 'offset')
+    def __init__(self, buffer, offsets, offset):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.offset = offset
+    def __len__(self):
+        return len(self.offsets) - 1
+    def __getitem__(self, i):
+        return self.buffer[self.offset + self.offsets[i]:self.offset + self.offsets[i + 1]]
+
+# A MappedTree is a CompactTree read from a snapshot file (see save)
+# The file is memory mapped, so nothing is read until it is queried
+class MappedTree(CompactTree):
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self.buffer, 0)
+        magic, version, count, strings, bits = header[0:5]
+        sections = header[5:]
+        if not magic == MAGIC or not version == VERSION:
+            self.close()
+            raise Exception('invalid snapshot file !')
+        self.parents = _MappedArray(self.buffer, sections[0], 'i', count)
+        self.names = _MappedArray(self.buffer, sections[1], 'i', count)
+        self.children = _MappedArray(self.buffer, sections[2], 'i', count)
+        self.siblings = _MappedArray(self.buffer, sections[3], 'i', count)
+        self.types = _MappedArray(self.buffer, sections[4], 'b', count)
+        self.masks = _MappedArray(self.buffer, sections[5], 'Q', count)
+        self.strings = _MappedStrings(self.buffer, _MappedArray(self.buffer, sections[6], 'I', strings + 1), sections[7])
+        self.bits = [folderTree.bit(self.strings[id]) for id in _MappedArray(self.buffer, sections[8], 'i', bits)]
+    # Returns the ruleset names of a (file) bitmask
+    def matches(self, mask):
+        out = 0
+        i = 0
+        while mask:
+            if mask & 1: out = out | self.bits[i]
+            mask = mask >> 1
+            i = i + 1
+        return folderTree.Matches(out)
+    def append(self, parent, name, type, matches = None):
+        raise Exception('read only tree !')
+    # Releases the file
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+# Returns a MappedTree from a snapshot file (see save)
+def load(path):
+    return MappedTree(path)
+
+#Unitary Tests
+if __name__ == "__main__":
+    tree = folderTree.get('test', ['foo', 'bar'])
+    compact = fromTree(tree)
+    if not len(compact) == 1: raise Exception('invalid lenght')
+    if not len(compact.first().content) == len(tree.first().content): raise Exception('invalid lenght')
+    if not sorted(folderTree.tolist(compact)) == sorted(folderTree.tolist(tree)): raise Exception('tolist')
+    if not sorted(folderTree.tolist(compact, ['foo', '!bar'])) == []: raise Exception('tolist with filters')
+    if not len(compact.strings) < len(compact.names): raise Exception('names are not interned')
+    compact = get('test', None, ['!.gitignore'])
+    if not sorted(folderTree.tolist(compact)) == sorted(folderTree.tolist(applyRules.walk('test'), ['!.gitignore'])): raise Exception('get')
+    print compact
+    import tempfile
+    fd, snapshot = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        save(compact, snapshot)
+        mapped = load(snapshot)
+        if not sorted(folderTree.tolist(mapped)) == sorted(folderTree.tolist(compact)): raise Exception('load')
+        mapped.close()
+        save(tree, snapshot)
+        mapped = load(snapshot)
+        if not sorted(folderTree.tolist(mapped, ['foo', 'bar'])) == sorted(folderTree.tolist(tree)): raise Exception('load with matches')
+        mapped.close()
+    finally:
+        os.remove(snapshot)
+    wide = CompactTree()
+    wide.append(-1, '', folderTree.FOLDER, ['wide%d' % i for i in range(0, 70)])
+    if not 'wide69' in wide.first().matches: raise Exception('more than 64 names')
+    print ""
+    print "utests ends with success"
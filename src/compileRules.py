@@ -0,0 +1,510 @@
+#!/usr/bin/python
+import re
+import os
+import fnmatch
+import collections
+import addRules
+import stats
+
+# Convert a shell glob into a regex body
+# (i.e. without the anchors/flags that fnmatch.translate adds)
+def _translate(glob):
+    res = fnmatch.translate(os.path.normcase(glob))
+    if res.endswith('\\Z(?ms)'):
+        # python 2
+        res = res[:-len('\\Z(?ms)')]
+    elif res.startswith('(?s:') and res.endswith(')\\Z'):
+        # python 3
+        res = res[len('(?s:'):-len(')\\Z')]
+    return '(?:' + res + ')'
+
+# Marker for a rule which matches any folder (see R9/R10)
+ANY = '**'
+
+# Returns the list of shell globs a rule will try against a basename
+# of the folder the rule belongs to
+# - an empty list means the rule can't match at this level
+#   (multi-level rules are handled by subRules)
+# - ANY means the rule matches anything
+def _globs(rule, isDir):
+    out = []
+    pattern = rule.pattern
+
+    # R4
+    # If the pattern ends with a slash,
+    # it is removed for the purpose of the following description,
+    # but it would only find a match with a directory.
+    # In other words, foo/ will match a directory foo and paths underneath it,
+    # but will not match a regular file or a symbolic link foo
+    # (this is consistent with the way how pathspec works in general in Git).
+    if rule.slash.trail:
+        if isDir:
+            pattern = pattern[:-1]
+        else:
+            return out
+
+    # R7
+    # A leading slash matches the beginning of the pathname.
+    # For example, "/*.c" matches "cat-file.c" but not "mozilla-sha1/sha1.c".
+    # -------> i.e. NO propagation
+    if rule.slash.lead:
+        pattern = pattern[1:]
+
+    # R8
+    # A leading "**" followed by a slash means match in all directories.
+    # For example, "**/foo" matches file or directory "foo" anywhere,
+    # the same as pattern "foo".
+    if pattern[0:3] == '**/':
+        pattern = pattern[3:]
+
+    # R6
+    # Otherwise, Git treats the pattern as a shell glob:
+    #   "*" matches anything except "/",
+    #   "?" matches any one character except "/"
+    #   and "[]" matches one character in a selected range.
+    # See fnmatch(3) and the FNM_PATHNAME flag for a more detailed description.
+    # -------> several levels are involved, see subRules
+    if pattern.find('/') <> -1:
+        return out
+
+    # R5
+    # If the pattern does not contain a slash /,
+    # Git treats it as a shell glob pattern
+    # and checks for a match against the pathname relative
+    # to the location of the .gitignore file
+    # (relative to the toplevel of the work tree if not from a .gitignore file).
+    if pattern == ANY:
+        return [ANY]
+    out.append(pattern)
+    return out
+
+# Returns the list of (hidden) Rule that a rule gives to a sub folder 'name'
+def _subRules(rule, name):
+    out = []
+    pattern = rule.pattern
+    trail = ''
+    if rule.slash.trail:
+        pattern = pattern[:-1]
+        trail = '/'
+    if rule.slash.lead:
+        pattern = pattern[1:]
+
+    # R5, R8: Propagation
+    if pattern.find('/') == -1:
+        if not rule.slash.lead:
+            out.append(rule)
+        return out
+    if pattern[0:3] == '**/':
+        out.append(rule)
+        pattern = pattern[3:]
+        if pattern.find('/') == -1: return out
+
+    # R6, R7, R9: NO Propagation, except if the first folder matches
+    folders = pattern.split('/', 1)
+    if not fnmatch.fnmatch(name, folders[0]):
+        return out
+    pattern = folders[1]
+
+    # R10
+    # A trailing "/**" matches everything inside.
+    # For example, "abc/**" matches all files inside directory "abc",
+    # relative to the location of the .gitignore file, with infinite depth.
+    if pattern == ANY:
+        out.append(addRules.Rule('**/*' + trail, True, rule.negate, rule.source))
+    elif pattern[0:3] == '**/':
+        out.append(addRules.Rule(pattern + trail, True, rule.negate, rule.source))
+    else:
+        out.append(addRules.Rule('/' + pattern + trail, True, rule.negate, rule.source))
+    return out
+
+# Returns how a rule goes down to the sub folders (see _subRules)
+# i.e. (propagated, segment)
+# - propagated : True if the rule is given unchanged to any sub folder
+# - segment : the glob a sub folder name must match for the rule to give
+#             the rest of its pattern (or None)
+def _steps(rule):
+    pattern = rule.pattern
+    if rule.slash.trail: pattern = pattern[:-1]
+    if rule.slash.lead: pattern = pattern[1:]
+    if pattern.find('/') == -1:
+        return not rule.slash.lead, None
+    propagated = False
+    if pattern[0:3] == '**/':
+        propagated = True
+        pattern = pattern[3:]
+        if pattern.find('/') == -1: return propagated, None
+    return propagated, pattern.split('/', 1)[0]
+
+# Returns True if a rule gives itself, and only itself, to any sub folder
+def _isStatic(rule):
+    return _steps(rule) == (True, None)
+
+# Returns the RuleSet inherited by the sub folder 'name'
+# i.e. the rules which are still meaningful one level below
+# Only the propagated rules, and the rules whose first folder matches 'name'
+# are considered (see CompiledRuleSet.literals)
+# note: the RuleSet may be shared (i.e. it must not be modified)
+def subRules(ruleset, name):
+    crs = compile(ruleset).update()
+    steps = crs.literals.get(os.path.normcase(name), [])
+    for i, segment in crs.globbed:
+        if fnmatch.fnmatch(name, segment): steps = steps + [i]
+    if len(steps) == 0:
+        # most sub folders get the propagated rules only
+        if crs.propagatedRules is None:
+            crs.propagatedRules = addRules.RuleSet([crs.rules[i].rule for i in crs.propagated])
+        return crs.propagatedRules
+    out = addRules.RuleSet()
+    for i in sorted(set(crs.propagated + steps)):
+        for sub in _subRules(crs.rules[i].rule, name):
+            out.append(sub)
+    return out
+
+# A CompiledRule is the precompiled version of one Rule
+# - rule : the original Rule
+# - file/folder : a compiled regex (or None if the rule can't match)
+# The regexes are only used rule by rule (stats, matchingRule), while
+# CompiledRuleSet.match uses GlobSets: they are compiled on first use
+class CompiledRule:
+    def __init__(self, rule):
+        self.rule = rule
+        self.file = None
+        self.folder = None
+        self.compiled = False
+    @staticmethod
+    def __compile(globs):
+        body = _body(globs)
+        if body is None: return None
+        return re.compile(body)
+    def match(self, path, isDir):
+        if not self.compiled:
+            self.file = CompiledRule.__compile(_globs(self.rule, False))
+            self.folder = CompiledRule.__compile(_globs(self.rule, True))
+            self.compiled = True
+        regex = self.folder if isDir else self.file
+        if regex is None: return False
+        return regex.match(path) is not None
+
+# Returns a regex source for a list of globs (or None if nothing can match)
+def _body(globs):
+    if len(globs) == 0: return None
+    if ANY in globs: return '(?s).*'
+    return '(?s)(?:' + '|'.join([_translate(g) for g in globs]) + ')\\Z'
+
+# Characters which make a glob more than a literal string
+_SPECIAL = re.compile('[*?[\\\\]')
+
+# A GlobSet matches a basename against a list of globs
+# Literal globs are looked up in hash tables, before any regex:
+# - names : exact basenames (i.e. '.DS_Store', or 'build' for 'build/')
+# - extensions : '*.ext' globs, by extension (i.e. '.o')
+# - prefixes : 'name*' globs, a Dictionnary of prefix length -> set of prefixes
+# - regex : the remaining (general) globs in a single alternation (or None)
+# The globs order doesn't matter, as any of them gives the same answer
+class GlobSet:
+    def __init__(self, globs):
+        self.any = ANY in globs
+        self.names = set()
+        self.extensions = set()
+        self.prefixes = {}
+        general = []
+        for glob in globs:
+            if glob == ANY: continue
+            glob = os.path.normcase(glob)
+            if _SPECIAL.search(glob) is None:
+                self.names.add(glob)
+            elif glob[0] == '*' and glob.rfind('.') == 1 and _SPECIAL.search(glob, 1) is None:
+                self.extensions.add(glob[1:])
+            elif glob[-1] == '*' and _SPECIAL.search(glob[:-1]) is None:
+                self.prefixes.setdefault(len(glob) - 1, set()).add(glob[:-1])
+            else:
+                general.append(glob)
+        body = _body(general)
+        self.regex = None if body is None else re.compile(body)
+    # Returns True if the (normcased) basename matches one of the globs
+    def match(self, path):
+        if self.any or path in self.names: return True
+        if len(self.extensions) > 0:
+            dot = path.rfind('.')
+            if dot <> -1 and path[dot:] in self.extensions: return True
+        for length in self.prefixes:
+            if path[:length] in self.prefixes[length]: return True
+        return not self.regex is None and not self.regex.match(path) is None
+
+# A MatchCache is a bounded LRU cache of match decisions
+# keyed by (rules context id, basename, isDir)
+# - size : maximum count of decisions
+# - hits/misses : counters
+class MatchCache:
+    def __init__(self, size = 65536):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.items = collections.OrderedDict()
+    def __len__(self):
+        return len(self.items)
+    # Returns the cached decision (or None)
+    def get(self, key):
+        value = self.items.pop(key, None)
+        if value is None:
+            self.misses = self.misses + 1
+            return None
+        self.items[key] = value
+        self.hits = self.hits + 1
+        return value
+    def set(self, key, value):
+        self.items[key] = value
+        if len(self.items) > self.size:
+            self.items.popitem(False)
+    def clear(self):
+        self.items.clear()
+        self.hits = 0
+        self.misses = 0
+
+_cache = None
+
+# Returns the MatchCache in use (or None if disabled)
+def currentCache():
+    return _cache
+
+# Enables the match decisions cache for every CompiledRuleSet
+def enableCache(size = 65536):
+    global _cache
+    _cache = MatchCache(size)
+    return _cache
+def disableCache():
+    global _cache
+    _cache = None
+
+# Rules contexts ids, i.e. a Dictionnary of patterns tuple -> id
+# rulesets holding the same patterns share the same id
+# It is cleared once it holds _IDS ids: an id is never given twice,
+# so a ruleset seen again only gets a new id (i.e. new cache entries)
+_ids = {}
+_IDS = 65536
+_nextId = 0
+
+# Returns the id of a patterns tuple (see _ids)
+def _id(key):
+    global _nextId
+    out = _ids.get(key)
+    if out is None:
+        if len(_ids) >= _IDS: _ids.clear()
+        out = _ids[key] = _nextId
+        _nextId = _nextId + 1
+    return out
+
+# A CompiledRuleSet is built once from a RuleSet
+# Consecutive rules of the same kind (exclude or negate) are gathered
+# into a single GlobSet for files and another one for folders
+# - groups : a list of (negate, file GlobSet, folder GlobSet)
+# The last matching rule wins, so groups are evaluated from the last one
+# and the first matching group gives the answer: most of the time
+# (no negation at all), a match costs a single GlobSet lookup
+# Rules also are indexed by how they go down to the sub folders (see subRules)
+# - propagated : indexes of the rules given unchanged to any sub folder
+# - literals : a Dictionnary of literal first folder -> indexes of the rules
+#              (i.e. '/services/web/dist/' is indexed by 'services')
+# - globbed : a list of (index, first folder glob) of the other rules
+# It follows the RuleSet changes (see RuleSet.version):
+# only the new rules are compiled again
+class CompiledRuleSet:
+    def __init__(self, ruleset):
+        if not isinstance(ruleset, addRules.RuleSet):
+            raise Exception('ruleset type excepted !')
+        self.ruleset = ruleset
+        self.version = None
+        self.rules = []
+        self.update()
+    def __len__(self):
+        self.update()
+        return len(self.rules)
+    # Compiles again the ruleset, if it has changed
+    def update(self):
+        if self.version == self.ruleset.version: return self
+        known = {}
+        for rule in self.rules:
+            known[(rule.rule.pattern, rule.rule.negate)] = rule
+        rules = []
+        for rule in self.ruleset:
+            compiled = known.get((rule.pattern, rule.negate))
+            if compiled is None or not compiled.rule is rule:
+                compiled = CompiledRule(rule)
+            rules.append(compiled)
+        self.rules = rules
+        self.propagated = []
+        self.propagatedRules = None
+        self.literals = {}
+        self.globbed = []
+        for i in range(0, len(rules)):
+            propagated, segment = _steps(rules[i].rule)
+            if propagated: self.propagated.append(i)
+            if segment is None: continue
+            if _SPECIAL.search(segment) is None:
+                self.literals.setdefault(os.path.normcase(segment), []).append(i)
+            else:
+                self.globbed.append((i, segment))
+        self.id = _id(tuple([(rule.rule.pattern, rule.rule.negate) for rule in rules]))
+        groups = []
+        group = []
+        for rule in rules:
+            if len(group) > 0 and not group[0].rule.negate == rule.rule.negate:
+                groups.append(group)
+                group = []
+            group.append(rule)
+        if len(group) > 0: groups.append(group)
+        self.groups = []
+        for group in reversed(groups):
+            self.groups.append((group[0].rule.negate, CompiledRuleSet.__combine(group, False), CompiledRuleSet.__combine(group, True)))
+        self.version = self.ruleset.version
+        return self
+    @staticmethod
+    def __combine(rules, isDir):
+        globs = []
+        for rule in rules:
+            globs = globs + _globs(rule.rule, isDir)
+        if len(globs) == 0: return None
+        return GlobSet(globs)
+    # Returns True if the path (a basename) is excluded by the rules
+    def match(self, path, isDir):
+        if not self.version == self.ruleset.version: self.update()
+        cache = _cache
+        if cache is None:
+            return self.__match(path, isDir)
+        key = (self.id, path, isDir)
+        out = cache.get(key)
+        if out is None:
+            out = self.__match(path, isDir)
+            cache.set(key, out)
+        return out
+    def __match(self, path, isDir):
+        path = os.path.normcase(path.replace('\\', '/'))
+        collector = stats.collector
+        if collector is None:
+            for negate, file, folder in self.groups:
+                globs = folder if isDir else file
+                if not globs is None and globs.match(path):
+                    return not negate
+            return False
+        # rules are evaluated one by one, for the sake of stats
+        for rule in reversed(self.rules):
+            start = stats.clock()
+            matched = rule.match(path, isDir)
+            collector.rule(_statsKey(rule.rule), matched, stats.clock() - start)
+            if matched: return not rule.rule.negate
+        return False
+    # Returns the Rule which decides for the path, i.e. the last matching one (or None)
+    # note: slower than match(), mainly used for diagnostics
+    def matchingRule(self, path, isDir):
+        self.update()
+        path = os.path.normcase(path.replace('\\', '/'))
+        for rule in reversed(self.rules):
+            if rule.match(path, isDir):
+                return rule.rule
+        return None
+
+# Returns the key of a rule in the stats (see stats.Stats.rule)
+# i.e. 'filepath:line:rule' as written in its file, so that the rules
+# derived from a multi-level rule (see subRules) are counted as the rule
+def _statsKey(rule):
+    if rule.source is None: return ('!' if rule.negate else '') + rule.pattern
+    return '%s:%d:%s' % rule.source
+
+# Returns the CompiledRuleSet of a RuleSet
+# (it is cached in the RuleSet, and kept up to date)
+def compile(ruleset):
+    if ruleset.compiled is None:
+        ruleset.compiled = CompiledRuleSet(ruleset)
+    return ruleset.compiled.update()
+
+#Unitary Tests
+if __name__ == "__main__":
+    R = addRules.Rule
+    rs = addRules.RuleSet([R('*.o'), R('build/'), R('/foo'), R('a/b'), R('**/bar'), R('abc/**')])
+    crs = compile(rs)
+    if not len(crs) == 6: raise Exception('invalid lenght')
+    if not crs.match('main.o', False): raise Exception('*.o on file')
+    if not crs.match('main.o', True): raise Exception('*.o on folder')
+    if crs.match('main.c', False): raise Exception('main.c')
+    if not crs.match('build', True): raise Exception('build/ on folder')
+    if crs.match('build', False): raise Exception('build/ on file')
+    if not crs.match('foo', False): raise Exception('/foo on file')
+    if crs.match('a', True): raise Exception('a/b on folder')
+    if crs.match('b', False): raise Exception('a/b on file')
+    if not crs.match('bar', False): raise Exception('**/bar on file')
+    if not crs.match('bar', True): raise Exception('**/bar on folder')
+    if crs.match('abc', True): raise Exception('abc/** on folder')
+    if not crs.matchingRule('build', True).pattern == 'build/': raise Exception('matchingRule')
+    if not crs.matchingRule('x', False) is None: raise Exception('matchingRule')
+    if compile(addRules.RuleSet()).match('x', False): raise Exception('empty ruleset')
+    if not compile(addRules.RuleSet([R('**/*', True)])).match('x', True): raise Exception('**/*')
+
+    if not compile(rs) is crs: raise Exception('compile cache')
+    lazy = compile(addRules.RuleSet([R('*.o'), R('build/')]))
+    if not (lazy.match('main.o', False) and not True in [rule.compiled for rule in lazy.rules]): raise Exception('regexes compiled by match')
+    if not (lazy.matchingRule('main.o', False).pattern == '*.o' and lazy.rules[0].compiled): raise Exception('regexes compiled on first use')
+    rs.append(R('*.c'))
+    if not crs.match('main.c', False): raise Exception('update on append')
+    rs.remove('*.c')
+    if crs.match('main.c', False): raise Exception('update on remove')
+    rs.remove('*.c')
+
+    globs = GlobSet(['*.o', '.DS_Store', 'build', 'tmp*', '*.tar.gz', '[ab]*.c', '*.p?'])
+    if not (len(globs.names) == 2 and len(globs.extensions) == 1 and len(globs.prefixes) == 1): raise Exception('literal buckets')
+    for name in ['main.o', '.o', '.DS_Store', 'build', 'tmp', 'tmp.txt', 'x.tar.gz', 'b.c', 'a.py']:
+        if not globs.match(name): raise Exception(name)
+    for name in ['main.c', 'main.oo', 'builds', 'atmp', 'x.gz', 'c.c', 'a.p']:
+        if globs.match(name): raise Exception(name)
+    if not GlobSet(['**']).match('any'): raise Exception('ANY')
+
+    negated = addRules.RuleSet([R('*.log'), R('build/'), R('important.log', False, True), R('keep/', False, True)])
+    ncrs = compile(negated)
+    if not len(ncrs.groups) == 2: raise Exception('groups')
+    if not ncrs.match('debug.log', False): raise Exception('*.log')
+    if ncrs.match('important.log', False): raise Exception('!important.log')
+    if not ncrs.matchingRule('important.log', False).negate: raise Exception('matchingRule')
+    if ncrs.match('keep', True): raise Exception('!keep/')
+    negated.append(R('*.log'))
+    if not ncrs.match('important.log', False): raise Exception('a rule appended again is moved to the end')
+    negated.remove('*.log')
+    if ncrs.match('debug.log', False): raise Exception('remove')
+    negated.append(R('*.log'))
+    if not ncrs.match('important.log', False): raise Exception('last rule wins')
+    anchored = addRules.RuleSet([R('*.o'), R('/services/web/dist/'), R('/services/api/'), R('/s*/x'), R('**/doc/api'), R('/dist')])
+    crs = compile(anchored)
+    if not (crs.propagated == [0, 4] and sorted(crs.literals) == ['doc', 'services'] and crs.globbed == [(3, 's*')]): raise Exception('steps')
+    for name in ['services', 'doc', 'src', 'dist']:
+        naive = addRules.RuleSet()
+        for rule in anchored:
+            for sub in _subRules(rule, name): naive.append(sub)
+        if not str(subRules(anchored, name)) == str(naive): raise Exception(name)
+    if not str(subRules(subRules(anchored, 'services'), 'web')) == "['*.o', ('/dist/'), '**/doc/api']": raise Exception(subRules(subRules(anchored, 'services'), 'web'))
+    sub = subRules(addRules.RuleSet([R('a/b', False, True)]), 'a')
+    if not sub[0].negate: raise Exception('negate sub rules')
+
+    cache = enableCache(2)
+    crs.match('main.o', False)
+    crs.match('main.o', False)
+    if not (cache.hits == 1 and cache.misses == 1): raise Exception('cache counters')
+    if not compile(addRules.RuleSet([R('*.o')])).match('main.o', False): raise Exception('cache key')
+    crs.match('a.o', False)
+    crs.match('b.o', False)
+    if not len(cache) == 2: raise Exception('cache size')
+    disableCache()
+    first = _id(('first',))
+    for i in range(0, _IDS): _id(('id%d' % i,))
+    if not (len(_ids) <= _IDS and not _id(('first',)) == first): raise Exception('bounded ids')
+
+    sub = subRules(rs, 'a')
+    print sub
+    if not str(sub) == "['*.o', 'build/', ('/b'), '**/bar']": raise Exception(sub)
+    if not compile(sub).match('b', False): raise Exception('a/b in a')
+    if compile(subRules(sub, 'c')).match('b', False): raise Exception('a/b in a/c')
+    sub = subRules(rs, 'abc')
+    if not compile(sub).match('x', False): raise Exception('abc/** in abc')
+    if not compile(subRules(sub, 'x')).match('y', True): raise Exception('abc/** in abc/x')
+    sub = subRules(addRules.RuleSet([R('a/**/b/')]), 'a')
+    if not str(sub) == "[('**/b/')]": raise Exception(sub)
+    if not compile(subRules(sub, 'x')).match('b', True): raise Exception('a/**/b/ in a/x')
+    print ""
+    print "utests ends with success"
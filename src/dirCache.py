@@ -0,0 +1,122 @@
+#!/usr/bin/python
+import os
+import cacheFile
+
+# Bumped whenever the entries content changes, so that old caches are dropped
+VERSION = 1
+
+# Returns the default cache file path
+# i.e. $XDG_CACHE_HOME/gitIgnorePython/dirs.cache
+def defaultPath():
+    return cacheFile.defaultPath(DirCache.filename)
+
+# A DirCache is a persistent index of folders listing (like git untracked cache)
+# (see cacheFile.CacheFile)
+# - entries : a Dictionnary of absolute folder path -> [stamp, listing, signature, matches]
+#             stamp : the folder (mtime, ctime, inode)
+#             listing : a list of (name, isdir)
+#             signature/matches : the rules context signature, and the list
+#             of matches (names) of every listed item for this context
+# - hits/misses : counters
+# A folder is listed again only if its stamp has changed
+# (a recently modified folder is not cached, see cacheFile.recent)
+# Folders are listed without the lock held, so that threads list concurrently
+class DirCache(cacheFile.CacheFile):
+    version = VERSION
+    filename = 'dirs.cache'
+    def __init__(self, path = None):
+        cacheFile.CacheFile.__init__(self, path)
+        self.hits = 0
+        self.misses = 0
+    # Returns the list of (name, isdir) of a folder
+    # - lister : called to list the folder when needed, yields (name, isdir, stat)
+    def list(self, path, lister):
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = (st.st_mtime, st.st_ctime, st.st_ino)
+        with self.lock:
+            entry = self.entries().get(key)
+            if not entry is None and entry[0] == stamp:
+                self.hits = self.hits + 1
+                return entry[1]
+            self.misses = self.misses + 1
+        listing = [(name, isdir) for name, isdir, stat in lister(path)]
+        with self.lock:
+            if not cacheFile.recent(stamp[0]):
+                self.entries()[key] = [stamp, listing, None, None]
+                self.dirty = True
+            elif key in self.entries():
+                del self.entries()[key]
+                self.dirty = True
+        return listing
+    # Returns the cached matches of a folder items (or None)
+    # - signature : the rules context signature
+    def matches(self, path, signature):
+        with self.lock:
+            entry = self.entries().get(os.path.abspath(path))
+            if entry is None or not entry[2] == signature: return None
+            return entry[3]
+    # Stores the matches of a folder items (see list() for the items order)
+    def setMatches(self, path, signature, matches):
+        with self.lock:
+            entry = self.entries().get(os.path.abspath(path))
+            if entry is None: return
+            entry[2] = signature
+            entry[3] = matches
+            self.dirty = True
+
+_current = cacheFile.Current(DirCache)
+
+# Returns the cache in use (or None if disabled)
+def current():
+    return _current.get()
+
+# Enables the cache for every folderTree.scan
+# it is saved at exit
+def enable(path = None):
+    return _current.enable(path)
+def disable():
+    _current.disable()
+
+#Unitary Tests
+if __name__ == "__main__":
+    # the module is imported, as __main__ is not the module folderTree sees
+    import time
+    import shutil
+    import tempfile
+    import dirCache
+    import folderTree
+    import applyRules
+    root = tempfile.mkdtemp()
+    cacheFolder = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(root, 'src'))
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\n')
+        open(os.path.join(root, 'src', 'a.o'), 'wb').write('')
+        past = time.time() - 10
+        for path in [root, os.path.join(root, 'src')]: os.utime(path, (past, past))
+        cache = dirCache.enable(os.path.join(cacheFolder, 'dirs.cache'))
+        expected = sorted(folderTree.tolist(applyRules.walk(root), ['!.gitignore']))
+        if not (cache.hits == 0 and cache.misses == 2): raise Exception('first walk')
+        cache.save()
+        cache = dirCache.enable(cache.path)
+        if not sorted(folderTree.tolist(applyRules.walk(root), ['!.gitignore'])) == expected: raise Exception('cached walk')
+        if not (cache.hits == 2 and cache.misses == 0): raise Exception('cached walk')
+        if cache.matches(os.path.join(root, 'src'), 'unknown') is not None: raise Exception('signature')
+        open(os.path.join(root, 'src', 'b.c'), 'wb').write('')
+        os.utime(os.path.join(root, 'src'), (past + 1, past + 1))
+        if not 'src/b.c' in folderTree.tolist(applyRules.walk(root), ['!.gitignore']): raise Exception('changed folder')
+        if not cache.misses == 1: raise Exception('changed folder')
+        many = os.path.join(root, 'many')
+        for i in range(0, 32):
+            os.makedirs(os.path.join(many, 'dir%d' % i))
+        for path in [many] + [os.path.join(many, 'dir%d' % i) for i in range(0, 32)]: os.utime(path, (past, past))
+        cache = dirCache.enable(os.path.join(cacheFolder, 'threads.cache'))
+        folderTree.get(many, None, False, 8)
+        if not len(cache.entries()) == 33: raise Exception('concurrent listings')
+        dirCache.disable()
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(cacheFolder)
+    print ""
+    print "utests ends with success"
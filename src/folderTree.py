@@ -1,15 +1,78 @@
 import os
+import sys
+import collections
+import stats
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
 
 FILE = 1
 FOLDER = 2
 
+# RuleSet names are interned to a bit (see Matches)
+_bitIds = {}
+_bitNames = []
+
+# Returns the bit of a RuleSet name
+# note: the count of names is not limited, as Matches is a long
+def bit(name):
+    id = _bitIds.get(name)
+    if id is None:
+        id = len(_bitNames)
+        _bitNames.append(name)
+        _bitIds[name] = id
+    return 1 << id
+
+# Matches is a set of RuleSet names, stored as a bitmask (see bit())
+# i.e. a long which also supports 'name in matches', iteration and len()
+class Matches(long):
+    __slots__ = ()
+    def __contains__(self, name):
+        id = _bitIds.get(name)
+        return not id is None and (self >> id) & 1 == 1
+    def __iter__(self):
+        mask = int(self)
+        id = 0
+        while mask:
+            if mask & 1: yield _bitNames[id]
+            mask = mask >> 1
+            id = id + 1
+    def __len__(self):
+        return bin(self).count('1')
+    def __repr__(self):
+        return 'Matches(' + repr(list(self)) + ')'
+    def __str__(self):
+        return str(list(self))
+
+# Returns the Matches of a list of RuleSet names (or of a bitmask)
+def toMatches(names):
+    if names is None: return Matches(0)
+    if isinstance(names, (int, long)): return Matches(names)
+    out = 0
+    for name in names:
+        out = out | bit(name)
+    return Matches(out)
+
 # A folder tree is actually a list of BaseItem, each defined by
 # - type : file or folder
-# - matches : A set of RulesSet name, that succeed
-class _BaseItem:
+# - matches : A set of RulesSet name, that succeed (see Matches)
+# - stat : the item os.stat_result (only if requested by get(), None otherwise)
+class _BaseItem(object):
+    __slots__ = ('type', '_matches', 'stat')
     def __init__(self, type, matches = None):
         self.type = type
-        self.matches = {} if matches is None else matches
+        self.matches = matches
+        self.stat = None
+    @property
+    def matches(self):
+        return self._matches
+    @matches.setter
+    def matches(self, matches):
+        self._matches = matches if isinstance(matches, Matches) else toMatches(matches)
     def __str__(self):
         if len(self.matches) == 0: return ''
         s = 'matches: ['
@@ -22,6 +85,7 @@ class _BaseItem:
 
 # A FileItem is a superset of BaseItem, to describe a file
 class FileItem(_BaseItem):
+    __slots__ = ()
     def __init__(self, matches = None):
         _BaseItem.__init__(self, FILE, matches)
 
@@ -29,6 +93,7 @@ class FileItem(_BaseItem):
 # - content : Provides a list of BaseItem (which means we get a nested definition of folders)
 # - rulesets : A list of ruleset, related to the current Folder and subsequent
 class FolderItem(_BaseItem):
+    __slots__ = ('content', 'rulesets')
     def __init__(self, matches = None, content = None):
         _BaseItem.__init__(self, FOLDER, matches)
         self.content = [] if content is None else content
@@ -49,31 +114,12 @@ class FolderItem(_BaseItem):
 # A Tree is actually a wrapper on
 # a Dictionnary of FileItem or FolderItem
 # the keys for file or folder basename
+# - ordered : if true, items are kept in insertion order
 class Tree():
-    def __init__(self):
-        self.items = {}
+    def __init__(self, ordered = False):
+        self.items = collections.OrderedDict() if ordered else {}
     def __str__(self):
-        s = ''
-        keys = self.items.keys()
-        keycount = len(keys)
-        for i in range(0, keycount):
-            key = keys[i]
-            value = self.items[key]
-            islast = i == keycount-1
-            head_mark = '\xc0' if islast else '\xc3'
-            cont_mark = ' ' if islast else '\xb3'
-            if value.type == FOLDER:
-                s = s + head_mark + '\xc4\xc4 "' + key + '/"\n'
-            elif value.type == FILE:
-                s = s + head_mark + '\xc4\xc4 "' + key + '"\n'
-            for csline in str(value).splitlines():
-                s = s + cont_mark + '   \xb3 - ' + csline + '\n'
-            if value.type == FOLDER:
-                for csline in str(value.content).splitlines():
-                    s = s + cont_mark + '   ' + csline + '\n'
-            if islast:
-                s = s + '\n'
-        return s
+        return render(self)
     def __iter__(self):
         return self.items.__iter__()
     def __getitem__(self, i):
@@ -81,6 +127,8 @@ class Tree():
     def __setitem__(self, i, v):
         self.items.__setitem__(i, v)
         return self
+    def __delitem__(self, i):
+        self.items.__delitem__(i)
     def __len__(self):
         return len(self.items)
     def first(self):
@@ -88,65 +136,201 @@ class Tree():
             return self.items[key]
         return None
 
+# Returns a human rendering of a Tree (or any object providing the same API)
+def render(tree):
+    s = ''
+    keys = list(tree)
+    keycount = len(keys)
+    for i in range(0, keycount):
+        key = keys[i]
+        value = tree[key]
+        islast = i == keycount-1
+        head_mark = '\xc0' if islast else '\xc3'
+        cont_mark = ' ' if islast else '\xb3'
+        if value.type == FOLDER:
+            s = s + head_mark + '\xc4\xc4 "' + key + '/"\n'
+        elif value.type == FILE:
+            s = s + head_mark + '\xc4\xc4 "' + key + '"\n'
+        for csline in str(value).splitlines():
+            s = s + cont_mark + '   \xb3 - ' + csline + '\n'
+        if value.type == FOLDER:
+            for csline in str(value.content).splitlines():
+                s = s + cont_mark + '   ' + csline + '\n'
+        if islast:
+            s = s + '\n'
+    return s
+
+# Returns the interned version of a name
+# (the same basenames are found over and over in a tree)
+def _intern(name):
+    try:
+        return intern(name)
+    except TypeError:
+        return name
+
+# Returns the dirCache.DirCache in use (or None)
+# dirCache is imported by whoever enables a cache: as long as it is not
+# imported, no cache is in use, and it is not imported for nothing
+def currentDirCache():
+    module = sys.modules.get('dirCache')
+    return None if module is None else module.current()
+
+# Returns (name, isdir, stat) for each entry of a folder
+# scandir is used when available, so that the folder type comes from
+# readdir d_type (scandir only stat the entry when d_type is unknown)
+# The folder listing comes from dirCache if it is enabled
+# - withStat : if false, stat is None
+def scan(path, withStat = False):
+    cache = currentDirCache()
+    if cache is None or withStat:
+        return __scan(path, withStat)
+    return [(name, isdir, None) for name, isdir in cache.list(path, __scan)]
+def __scan(path, withStat = False):
+    if _scandir is None:
+        for item in os.listdir(path):
+            subpath = os.path.join(path, item)
+            stat = os.stat(subpath) if withStat else None
+            yield _intern(item), os.path.isdir(subpath), stat
+        return
+    for entry in _scandir(path):
+        stat = entry.stat() if withStat else None
+        yield _intern(entry.name), entry.is_dir(), stat
+
 # Returns a new Tree Object based on its content
 # - initialMatches : An optional param to prefed .matches (mainly used for test)
-def get(path, initialMatches = None):
+# - withStat : if true, items .stat are filled up
+# - workers : if more than 1, folders of a same depth are listed concurrently
+#             by a pool of 'workers' threads (useful on network file systems)
+# - sort : if true, items are sorted by name (deterministic ordering)
+def get(path, initialMatches = None, withStat = False, workers = 0, sort = False):
     initialMatches = [] if initialMatches is None else initialMatches
-    out = Tree()
-    out[path] = FolderItem(initialMatches, __get(path, initialMatches))
+    out = Tree(sort)
+    with stats.phase('walk'):
+        if workers > 1:
+            content = __getParallel(path, initialMatches, withStat, workers, sort)
+        else:
+            content = __get(path, initialMatches, withStat, sort)
+    out[path] = FolderItem(initialMatches, content)
+    if withStat: out[path].stat = os.stat(path)
     return out
-def __get(path, initialMatches = None):
+def __get(path, initialMatches = None, withStat = False, sort = False):
     initialMatches = [] if initialMatches is None else initialMatches
-    out = Tree()
-    for item in os.listdir(path):
-        subpath = os.path.join(path, item)
-        if os.path.isdir(subpath):
-            out[item] = FolderItem(initialMatches, __get(subpath, initialMatches))
+    out = Tree(sort)
+    items = scan(path, withStat)
+    if sort: items = sorted(items)
+    for item, isdir, stat in items:
+        if isdir:
+            out[item] = FolderItem(initialMatches, __get(os.path.join(path, item), initialMatches, withStat, sort))
         else:
             out[item] = FileItem(initialMatches)
+        out[item].stat = stat
+    return out
+def __getParallel(path, initialMatches, withStat, workers, sort):
+    # imported here, as it is slow to import and seldom used
+    from multiprocessing.pool import ThreadPool
+    out = Tree(sort)
+    pool = ThreadPool(workers)
+    try:
+        # breadth first: a whole depth level is listed at once
+        level = [(path, out)]
+        while len(level) > 0:
+            listings = pool.map(lambda folder: list(scan(folder[0], withStat)), level, 1)
+            nextLevel = []
+            for (folder, tree), items in zip(level, listings):
+                if sort: items.sort()
+                for item, isdir, stat in items:
+                    if isdir:
+                        content = Tree(sort)
+                        tree[item] = FolderItem(initialMatches, content)
+                        nextLevel.append((os.path.join(folder, item), content))
+                    else:
+                        tree[item] = FileItem(initialMatches)
+                    tree[item].stat = stat
+            level = nextLevel
+    finally:
+        pool.close()
+        pool.join()
     return out
 
-# Convert a dictionary of BaseItem into a list of path (based on filters options)
-def __tolist(tree, filters, base):
-    out = []
+# Returns the (required, forbidden) bitmasks of a list of filters
+# - filters : A list of RuleSet name which must be in matches
+#             or must not be in matches if prefixed with '!'
+# Names are looked up without being given a bit (see bit()):
+# an unknown required name makes required NOTHING, which no matches satisfies,
+# an unknown forbidden name is ignored
+NOTHING = -1
+def compileFilters(filters):
+    required = 0
+    forbidden = 0
+    for filter in filters:
+        if not filter:
+            continue
+        if filter[0] == '!':
+            id = _bitIds.get(filter[1:])
+            if not id is None: forbidden = forbidden | (1 << id)
+        else:
+            id = _bitIds.get(filter)
+            required = NOTHING if id is None or required == NOTHING else required | (1 << id)
+    return required, forbidden
+
+# Returns True if matches satisfies every filter (see compileFilters)
+def accept(matches, filters):
+    required, forbidden = compileFilters(filters)
+    matches = toMatches(matches)
+    return (matches & required) == required and not matches & forbidden
+
+# Yields the paths of a dictionary of BaseItem (based on compiled filters)
+def __iterlist(tree, required, forbidden, base):
     for key in tree:
         value = tree[key]
-        # filters
-        ok = True
-        for filter in filters:
-            if not filter:
-                continue
-            if filter[0] == '!':
-                filter = filter[1:]
-                if not (filter in value.matches):
-                    continue
-            else:
-                if filter in value.matches:
-                    continue
-            ok = False
-            break
-        if not ok:
+        matches = value.matches
+        if not (matches & required) == required or matches & forbidden:
             continue
-        # append path
         newbase = os.path.join(base, key)
+        yield newbase
         if value.type == FOLDER:
-            out.append(newbase)
-            out = out + __tolist(value.content, filters, newbase)
-        elif value.type == FILE:
-            out.append(newbase)
-    return out
+            for path in __iterlist(value.content, required, forbidden, newbase):
+                yield path
 
-# Convert a dictionary of BaseItem into a list of path (based on filters options)
-def tolist(tree, filters = None):
+# Yields the paths of a tree (based on filters options)
+def iterlist(tree, filters = None):
     filters = [] if filters is None else filters
     item = tree.first()
     if item:
-        return __tolist(item.content, filters, '')
+        required, forbidden = compileFilters(filters)
+        return __iterlist(item.content, required, forbidden, '')
     else:
-        return []
+        return iter([])
+
+# Convert a dictionary of BaseItem into a list of path (based on filters options)
+def tolist(tree, filters = None):
+    with stats.phase('tolist'):
+        return list(iterlist(tree, filters))
 
 #Unitary Tests
 if __name__ == "__main__":
+    count = len(_bitNames)
+    for i in range(0, 100):
+        if not compileFilters(['!typo%d' % i]) == (0, 0): raise Exception('unknown forbidden name')
+        if not compileFilters(['typo%d' % i])[0] == NOTHING: raise Exception('unknown required name')
+    if not len(_bitNames) == count: raise Exception('filters must not take bits')
+    if accept(toMatches(['foo']), ['foo', 'typo']): raise Exception('unknown required name')
+    many = toMatches(['name%d' % i for i in range(0, 100)])
+    if not ('name99' in many and len(many) == 100 and accept(many, ['name70', '!typo'])): raise Exception('more than 62 names')
+    import shutil
+    import tempfile
+    root = tempfile.mkdtemp()
+    try:
+        for i in range(0, 4):
+            for j in range(0, 3):
+                os.makedirs(os.path.join(root, 'dir%d' % i, 'sub%d' % j))
+                open(os.path.join(root, 'dir%d' % i, 'sub%d' % j, 'file'), 'wb').close()
+        if not get(root).first().stat is None: raise Exception('stat should not be set')
+        if get(root, None, True).first().content['dir0'].stat is None: raise Exception('stat should be set')
+        serial = tolist(get(root, None, False, 0, True))
+        if not (len(serial) == 28 and serial == tolist(get(root, None, False, 8, True))): raise Exception('workers')
+    finally:
+        shutil.rmtree(root)
     tree = get('test', ['foo', 'bar'])
     if not len(tree) == 1: raise Exception('invalid lenght')
     if not len(tree.first().content) == 15: raise Exception('invalid lenght')
@@ -0,0 +1,329 @@
+#!/usr/bin/python
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import SocketServer
+import folderTree
+import applyRules
+import watchTree
+
+# Returns the default socket path
+# i.e. $XDG_RUNTIME_DIR/gitIgnorePython.sock (or in the temporary folder)
+def defaultPath():
+    base = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(base, 'gitIgnorePython-%d.sock' % os.getuid())
+
+# json strings are unicode, while paths are kept as str
+def _str(s):
+    return s.encode('utf-8') if isinstance(s, unicode) else s
+
+# A Root holds the annotated Tree of a folder (see applyRules.walk)
+# kept up to date by a Watcher (see refresh)
+# - filenames : rules files (ruleset name is the filename)
+# The tree is built by load(), and 'loaded' is set once it is done
+# (the tree is None if the walk failed, see failure)
+# - error : message of the last refresh error (None if the last refresh succeeded)
+class Root:
+    def __init__(self, path, filenames = None):
+        self.path = path
+        self.filenames = ['.gitignore'] if filenames is None else filenames
+        self.prune = folderTree.toMatches(self.filenames)
+        self.lock = threading.Lock()
+        self.loaded = threading.Event()
+        self.tree = None
+        self.watcher = None
+        self.failure = None
+        self.error = None
+    # Walks the folder
+    def load(self):
+        try:
+            tree = applyRules.walk(self.path, self.filenames)
+            with self.lock:
+                self.tree = tree
+                self.watcher = watchTree.Watcher(tree, self.filenames)
+        except Exception as e:
+            self.failure = e
+        finally:
+            self.loaded.set()
+    # Checks the file system once (see Watcher.poll)
+    # an error is recorded (see error) before being raised
+    def refresh(self):
+        with self.lock:
+            try:
+                changed = self.watcher.poll()
+            except Exception as e:
+                self.error = str(e) or e.__class__.__name__
+                raise
+            self.error = None
+            return changed
+    # Returns the Matches of a path (relative to the root, or below the root)
+    # A path which is not part of the tree (below a pruned folder, or not
+    # listed yet) is matched with the rules of its nearest known folder
+    def check(self, path, isDir = False):
+        with self.lock:
+            names = [name for name in applyRules.relativePath(self.path, path).split(os.sep) if name]
+            if len(names) == 0: return folderTree.Matches(0)
+            folder = self.tree.first()
+            inherited = {}
+            for i in range(0, len(names)):
+                name = names[i]
+                if name in folder.content:
+                    value = folder.content[name]
+                    if i == len(names) - 1: return value.matches
+                    if value.type == folderTree.FOLDER:
+                        if value.matches & self.prune: return value.matches
+                        inherited = applyRules.folderContext(folder.rulesets, inherited).sub(name)
+                        folder = value
+                        continue
+                # unknown path: the rules of 'folder' are applied to the rest of it
+                rest = '/'.join(names[i:]) + ('/' if isDir else '')
+                context = applyRules.folderContext(folder.rulesets, inherited)
+                for itempath, itemIsDir, matches in applyRules.classify([rest], {'': context}):
+                    return folderTree.toMatches(int(matches) | int(folder.matches or 0))
+    # Returns the paths of the tree (see folderTree.tolist)
+    def list(self, filters = None):
+        with self.lock:
+            return folderTree.tolist(self.tree, filters)
+
+# A Server answers requests about one or more roots over a Unix socket
+# Every request is a json object on a single line, answered by a json line
+# - {"cmd": "check", "root": path, "path": path, "dir": false} -> {"matches": [names]}
+# - {"cmd": "list", "root": path, "filters": [filters]} -> {"paths": [paths]}
+# - {"cmd": "roots"} -> {"roots": [paths]}
+# - {"cmd": "stop"} -> {}
+# an error is answered by {"error": message}
+# Roots are loaded on their first request, then refreshed every 'interval' seconds
+# if the last refresh of a root failed, its answers hold {"refreshError": message}
+# (i.e. the answer may be out of date)
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+    def __init__(self, path = None, filenames = None, interval = 1.0):
+        self.path = defaultPath() if path is None else path
+        self.filenames = filenames
+        self.interval = interval
+        self.roots = {}
+        self.stopping = False
+        self.rootsLock = threading.Lock()
+        if os.path.exists(self.path):
+            if _alive(self.path): raise Exception('a server is already running on ' + self.path)
+            os.remove(self.path)
+        SocketServer.UnixStreamServer.__init__(self, self.path, _Handler)
+        os.chmod(self.path, 0600)
+    # Returns the Root of a folder (loaded if needed)
+    # The folder is walked without the lock held: the other roots are still
+    # served meanwhile, while the requests on the same root wait for it
+    def root(self, path):
+        path = os.path.abspath(_str(path))
+        with self.rootsLock:
+            root = self.roots.get(path)
+            owner = root is None
+            if owner:
+                if not os.path.isdir(path): raise Exception('invalid root: ' + path)
+                root = self.roots[path] = Root(path, self.filenames)
+        if owner: root.load()
+        root.loaded.wait()
+        if not root.failure is None:
+            with self.rootsLock:
+                if self.roots.get(path) is root: del self.roots[path]
+            raise root.failure
+        return root
+    # Answers a request (a Dictionnary)
+    def answer(self, request):
+        cmd = request.get('cmd')
+        if cmd == 'check':
+            root = self.root(request['root'])
+            return _answer(root, {'matches': list(root.check(_str(request['path']), request.get('dir', False)))})
+        if cmd == 'list':
+            root = self.root(request['root'])
+            return _answer(root, {'paths': root.list([_str(f) for f in request.get('filters', [])])})
+        if cmd == 'roots':
+            return {'roots': sorted(self.roots)}
+        if cmd == 'stop':
+            self.stopping = True
+            return {}
+        raise Exception('unknown command: ' + str(cmd))
+    def __refresh(self):
+        while True:
+            time.sleep(self.interval)
+            for root in list(self.roots.values()):
+                if not root.loaded.is_set() or root.tree is None: continue
+                try:
+                    root.refresh()
+                except Exception:
+                    # recorded by the root, and answered with its requests
+                    pass
+    # Serves until a 'stop' request
+    def run(self):
+        refresher = threading.Thread(target=self.__refresh)
+        refresher.daemon = True
+        refresher.start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            if os.path.exists(self.path): os.remove(self.path)
+
+# Adds the last refresh error of a root to an answer
+def _answer(root, out):
+    error = root.error
+    if not error is None: out['refreshError'] = error
+    return out
+
+# Returns True if a server answers on a socket path
+def _alive(path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        probe.close()
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if not line.strip(): continue
+            try:
+                out = self.server.answer(json.loads(line))
+            except Exception as e:
+                out = {'error': str(e)}
+            self.wfile.write(json.dumps(out) + '\n')
+            self.wfile.flush()
+            if self.server.stopping:
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+# A Client sends requests to a Server (see Server for the protocol)
+# - refreshError : the refresh error of the last answer (see Server), if any
+class Client:
+    def __init__(self, path = None):
+        self.refreshError = None
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(defaultPath() if path is None else path)
+        self.file = self.socket.makefile('rwb')
+    def close(self):
+        self.file.close()
+        self.socket.close()
+    # Sends a request, and returns the answer (a Dictionnary)
+    def request(self, **request):
+        self.file.write(json.dumps(request) + '\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line: raise Exception('connection closed by the server !')
+        out = json.loads(line)
+        if 'error' in out: raise Exception(out['error'])
+        self.refreshError = out.get('refreshError')
+        return out
+    # Returns the Matches of a path (relative to the root, or absolute)
+    def check(self, root, path, isDir = False):
+        return folderTree.toMatches([_str(name) for name in self.request(cmd='check', root=os.path.abspath(root), path=path, dir=isDir)['matches']])
+    # Returns the paths of a root (see folderTree.tolist)
+    def list(self, root, filters = None):
+        return [_str(path) for path in self.request(cmd='list', root=os.path.abspath(root), filters=[] if filters is None else filters)['paths']]
+    def stop(self):
+        self.request(cmd='stop')
+
+# Unitary Tests (run without arguments)
+def _test():
+    import shutil
+    import tempfile
+    folder = tempfile.mkdtemp()
+    try:
+        root = os.path.join(folder, 'root')
+        os.mkdir(root)
+        for name in ['a.c', 'a.o']:
+            open(os.path.join(root, name), 'wb').close()
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\n')
+        path = os.path.join(folder, 'daemon.sock')
+        server = Server(path, None, 0.05)
+        thread = threading.Thread(target=server.run)
+        # a failing test must not wait for the server forever
+        thread.daemon = True
+        thread.start()
+        try:
+            Server(path)
+            raise Exception('running server taken over')
+        except Exception as e:
+            if not 'already running' in str(e): raise
+        client = Client(path)
+        if not '.gitignore' in client.check(root, 'a.o'): raise Exception('check')
+        if '.gitignore' in client.check(root, os.path.join(root, 'a.c')): raise Exception('check absolute path')
+        if not '.gitignore' in client.check(root, 'build/x.o'): raise Exception('check unknown path')
+        if not sorted(client.list(root, ['!.gitignore'])) == ['.gitignore', 'a.c']: raise Exception('list')
+        if not client.request(cmd='roots')['roots'] == [root]: raise Exception('roots')
+        try:
+            client.check(os.path.join(folder, 'missing'), 'a.c')
+            raise Exception('invalid root')
+        except Exception as e:
+            if not 'invalid root' in str(e): raise
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\n*.c\n')
+        open(os.path.join(root, 'b.c'), 'wb').close()
+        deadline = time.time() + 5
+        while client.list(root, ['!.gitignore']) != ['.gitignore']:
+            if time.time() > deadline: raise Exception('refresh')
+            time.sleep(0.05)
+        if not '.gitignore' in client.check(root, 'b.c'): raise Exception('check after refresh')
+        def fail():
+            raise OSError('poll failed')
+        server.root(root).watcher.poll = fail
+        deadline = time.time() + 5
+        while client.refreshError is None:
+            if time.time() > deadline: raise Exception('refresh error')
+            client.list(root)
+            time.sleep(0.05)
+        if not client.refreshError == 'poll failed': raise Exception(client.refreshError)
+        client.stop()
+        client.close()
+        thread.join(5)
+        if thread.is_alive(): raise Exception('stop')
+        if os.path.exists(path): raise Exception('socket not removed')
+    finally:
+        shutil.rmtree(folder)
+    print ""
+    print "utests ends with success"
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        _test()
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description='gitIgnorePython daemon')
+    parser.add_argument('-s', '--socket', help='socket path (default: %s)' % defaultPath())
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help='runs the server')
+    serve.add_argument('roots', nargs='*', help='roots to load at once')
+    serve.add_argument('--interval', type=float, default=1.0, help='refresh interval (seconds)')
+    serve.add_argument('--rules', action='append', help='rules files (default: .gitignore)')
+    check = commands.add_parser('check', help='prints the matches of some paths')
+    check.add_argument('root')
+    check.add_argument('paths', nargs='+')
+    listing = commands.add_parser('list', help='prints the paths of a root')
+    listing.add_argument('root')
+    listing.add_argument('--filter', action='append', default=[], help='i.e. !.gitignore')
+    commands.add_parser('stop', help='stops the server')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server = Server(args.socket, args.rules, args.interval)
+        for path in args.roots:
+            server.root(path)
+        server.run()
+        sys.exit(0)
+    client = Client(args.socket)
+    try:
+        if args.command == 'check':
+            for path in args.paths:
+                sys.stdout.write('%s\t%s\n' % (path, ','.join(client.check(args.root, path, path.endswith('/')))))
+        elif args.command == 'list':
+            for path in client.list(args.root, args.filter):
+                sys.stdout.write(path + '\n')
+        elif args.command == 'stop':
+            client.stop()
+        if not client.refreshError is None:
+            sys.stderr.write('warning: the tree may be out of date (%s)\n' % client.refreshError)
+    finally:
+        client.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+import os
+import cacheFile
+
+# Bumped whenever Rule content changes, so that old caches are dropped
+VERSION = 3
+
+# Returns the default cache file path
+# i.e. $XDG_CACHE_HOME/gitIgnorePython/rules.cache
+def defaultPath():
+    return cacheFile.defaultPath(RuleCache.filename)
+
+# Returns the key which tells if a file has changed
+def _stamp(filepath):
+    st = os.stat(filepath)
+    return (st.st_ino, st.st_size, st.st_mtime)
+
+# A RuleCache is a persistent cache of parsed rules files (see cacheFile.CacheFile)
+# - entries : a Dictionnary of absolute filepath -> (stamp, list of Rule)
+#             where stamp is the file (inode, size, mtime)
+# A recently modified file is not cached (see cacheFile.recent)
+class RuleCache(cacheFile.CacheFile):
+    version = VERSION
+    filename = 'rules.cache'
+    # Returns the cached rules of a file (or None if unknown or outdated)
+    def get(self, filepath):
+        with self.lock:
+            entry = self.entries().get(os.path.abspath(filepath))
+        if entry is None: return None
+        if not entry[0] == _stamp(filepath): return None
+        return entry[1]
+    # Stores the rules of a file
+    def set(self, filepath, rules):
+        stamp = _stamp(filepath)
+        if cacheFile.recent(stamp[2]): return
+        with self.lock:
+            self.entries()[os.path.abspath(filepath)] = (stamp, list(rules))
+            self.dirty = True
+
+_current = cacheFile.Current(RuleCache)
+
+# Returns the cache in use (or None if disabled)
+def current():
+    return _current.get()
+
+# Enables the cache for every RuleSet.loadfromfile
+# it is saved at exit
+def enable(path = None):
+    return _current.enable(path)
+def disable():
+    _current.disable()
+
+#Unitary Tests
+if __name__ == "__main__":
+    import time
+    import shutil
+    import tempfile
+    import addRules
+    folder = tempfile.mkdtemp()
+    try:
+        rulesfile = os.path.join(folder, '.gitignore')
+        f = open(rulesfile, 'wb')
+        f.write('*.o\nbuild/\n')
+        f.close()
+        os.utime(rulesfile, (time.time() - 10, time.time() - 10))
+        cache = RuleCache(os.path.join(folder, 'cache', 'rules.cache'))
+        if not cache.get(rulesfile) is None: raise Exception('empty cache')
+        rs = addRules.RuleSet().loadfromfile(rulesfile, cache)
+        cache.save()
+        cache = RuleCache(cache.path)
+        if not len(cache.get(rulesfile)) == 2: raise Exception('cache not saved')
+        if not str(addRules.RuleSet().loadfromfile(rulesfile, cache)) == str(rs): raise Exception('cache content')
+        f = open(rulesfile, 'ab')
+        f.write('dist/\n')
+        f.close()
+        if not cache.get(rulesfile) is None: raise Exception('outdated cache')
+        if not len(addRules.RuleSet().loadfromfile(rulesfile, cache)) == 3: raise Exception('outdated cache')
+    finally:
+        shutil.rmtree(folder)
+    print ""
+    print "utests ends with success"
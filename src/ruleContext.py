@@ -0,0 +1,148 @@
+#!/usr/bin/python
+import weakref
+import collections
+import addRules
+import compileRules
+import folderTree
+
+# Living Contexts by key (see get)
+_contexts = weakref.WeakValueDictionary()
+# The _RECENT last Contexts got are kept alive, the other ones are
+# freed once nothing refers to them (i.e. after a rules change)
+_recent = collections.OrderedDict()
+_RECENT = 1024
+
+# A Context is the immutable set of rules in effect in a folder
+# i.e. the rules inherited from parent folders followed by the folder's own rules
+# It reads like a Dictionnary of ruleset name -> RuleSet (not to be modified)
+# - key : the (pattern, negate) of every rule of every ruleset
+# - static : True if every rule is given unchanged to any sub folder
+#            (i.e. the Context of every sub folder is the Context itself)
+# Contexts are shared by every folder having the same rules (see get),
+# so whatever is derived from a Context is computed once, while it lives:
+# - compiled() : a list of (ruleset name bit, CompiledRuleSet)
+# - digest() : a digest of its rules (see applyRules._signature)
+# - sub(name) : the Context of a sub folder
+# - extend(local) : the Context of a folder with its own rules
+class Context:
+    def __init__(self, rulesets, key):
+        self.rulesets = rulesets
+        self.key = key
+        self.static = True
+        for name in rulesets:
+            for rule in rulesets[name]:
+                if not compileRules._isStatic(rule): self.static = False
+        self.__compiled = None
+        self.__digest = None
+        # weak, so that a Context doesn't keep alive every Context derived from it
+        self.__subs = weakref.WeakValueDictionary()
+        self.__extended = weakref.WeakValueDictionary()
+    def __iter__(self):
+        return iter(self.rulesets)
+    def __getitem__(self, name):
+        return self.rulesets[name]
+    def __contains__(self, name):
+        return name in self.rulesets
+    def __len__(self):
+        return len(self.rulesets)
+    def compiled(self):
+        if self.__compiled is None:
+            self.__compiled = [(folderTree.bit(name), compileRules.compile(self.rulesets[name])) for name in self.rulesets]
+        return self.__compiled
+    def digest(self):
+        if self.__digest is None:
+            # imported here, as it is only used along with dirCache
+            import hashlib
+            digest = hashlib.md5()
+            for name, keys in self.key:
+                digest.update(name + '\0' + '\0'.join([str(int(negate)) + pattern for pattern, negate in keys]) + '\1')
+            self.__digest = digest.digest()
+        return self.__digest
+    # Returns the Context inherited by the sub folder 'name'
+    def sub(self, name):
+        if self.static: return self
+        out = self.__subs.get(name)
+        if out is None:
+            rulesets = {}
+            for key in self.rulesets:
+                sub = compileRules.subRules(self.rulesets[key], name)
+                if len(sub) > 0: rulesets[key] = sub
+            out = self.__subs[name] = get(rulesets)
+        return out
+    # Returns the Context followed by the rules of 'local'
+    # - local : a Dictionnary of RuleSet (see FolderItem.rulesets)
+    def extend(self, local):
+        if len(local) == 0: return self
+        localKey = _key(local)
+        out = self.__extended.get(localKey)
+        if out is None:
+            rulesets = dict(self.rulesets)
+            for name in local:
+                rs = addRules.RuleSet(rulesets[name]) if name in rulesets else addRules.RuleSet()
+                for rule in local[name]:
+                    rs.append(rule)
+                rulesets[name] = rs
+            out = self.__extended[localKey] = get(rulesets)
+        return out
+
+# Returns the key of a Dictionnary of RuleSet (see Context)
+def _key(rulesets):
+    return tuple(sorted([(name, tuple([addRules._key(rule) for rule in rulesets[name]])) for name in rulesets]))
+
+# Returns the Context of a Dictionnary of RuleSet
+# i.e. the one already built for the same rules if any
+def get(rulesets):
+    key = _key(rulesets)
+    out = _contexts.get(key)
+    if out is None:
+        out = Context(rulesets, key)
+        _contexts[key] = out
+    _recent.pop(key, None)
+    _recent[key] = out
+    if len(_recent) > _RECENT: _recent.popitem(False)
+    return out
+
+# Forgets the recently got Contexts (see _recent)
+# i.e. the next walks compute their Contexts again (cold benchmarks)
+def clear():
+    import gc
+    _recent.clear()
+    gc.collect()
+
+# The Context without any rule
+EMPTY = get({})
+
+#Unitary Tests
+if __name__ == "__main__":
+    R = addRules.Rule
+    rs = {'.gitignore': addRules.RuleSet([R('*.o'), R('build/')])}
+    root = EMPTY.extend(rs)
+    if not root is get({'.gitignore': addRules.RuleSet([R('*.o'), R('build/')])}): raise Exception('shared')
+    if not root is EMPTY.extend(rs): raise Exception('extend memoized')
+    if not (root.static and root.sub('src') is root): raise Exception('static')
+    if not root.extend({}) is root: raise Exception('nothing to extend')
+    if not str(root['.gitignore']) == "['*.o', 'build/']": raise Exception(root['.gitignore'])
+    anchored = root.extend({'.gitignore': addRules.RuleSet([R('/dist'), R('doc/api/')])})
+    if anchored.static: raise Exception('anchored rules')
+    if not str(anchored['.gitignore']) == "['*.o', 'build/', '/dist', 'doc/api/']": raise Exception(anchored['.gitignore'])
+    if not anchored.sub('src') is root: raise Exception('anchored rules are not inherited')
+    doc = anchored.sub('doc')
+    if not doc is anchored.sub('doc'): raise Exception('sub memoized')
+    if not len(doc['.gitignore']) == 3: raise Exception(doc['.gitignore'])
+    if not doc.compiled() is doc.compiled(): raise Exception('compiled once')
+    if doc.digest() == root.digest(): raise Exception('digest')
+    if not len(rs['.gitignore']) == 2: raise Exception('local rules are not modified')
+    logs = EMPTY.extend({'.gitignore': addRules.RuleSet([R('*.log'), R('important.log', False, True)])})
+    logs = logs.extend({'.gitignore': addRules.RuleSet([R('*.log')])})
+    if not str(logs['.gitignore']) == "['!important.log', '*.log']": raise Exception('a rule appended again is moved to the end')
+    if not logs.compiled()[0][1].match('important.log', False): raise Exception('last match wins')
+    for i in range(0, 2 * _RECENT):
+        EMPTY.extend({'.gitignore': addRules.RuleSet([R('*.tmp%d' % i)])}).compiled()
+    import gc
+    gc.collect()
+    if not len(_contexts) <= _RECENT + 10: raise Exception('%d Contexts alive' % len(_contexts))
+    if not root is EMPTY.extend(rs): raise Exception('a Context in use is kept')
+    clear()
+    if not len(_contexts) <= 10: raise Exception('%d Contexts alive' % len(_contexts))
+    print ""
+    print "utests ends with success"
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+import sys
+import time
+
+# The best timer of the platform (as timeit.default_timer, without importing timeit)
+clock = time.clock if sys.platform == 'win32' else time.time
+
+# A Stats collects
+# - phases : a Dictionnary of phase name (walk, load, match...) -> [calls, time]
+# - rules : a Dictionnary of rule -> [evaluations, matches, time]
+#           a rule read from a file is 'filepath:line:rule' (see compileRules._statsKey)
+# time being cumulated seconds
+class Stats:
+    def __init__(self):
+        self.phases = {}
+        self.rules = {}
+    def phase(self, name, duration):
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = [0, 0.0]
+        entry[0] = entry[0] + 1
+        entry[1] = entry[1] + duration
+    def rule(self, pattern, matched, duration):
+        entry = self.rules.get(pattern)
+        if entry is None:
+            entry = self.rules[pattern] = [0, 0, 0.0]
+        entry[0] = entry[0] + 1
+        if matched: entry[1] = entry[1] + 1
+        entry[2] = entry[2] + duration
+    def clear(self):
+        self.phases = {}
+        self.rules = {}
+    # Returns a plain Dictionnary (i.e. json friendly) of the stats
+    def todict(self):
+        out = {'phases': {}, 'rules': {}}
+        for name in self.phases:
+            calls, time = self.phases[name]
+            out['phases'][name] = {'calls': calls, 'time': time}
+        for pattern in self.rules:
+            evaluations, matches, time = self.rules[pattern]
+            out['rules'][pattern] = {'evaluations': evaluations, 'matches': matches, 'time': time}
+        return out
+    def __str__(self):
+        s = 'phases:\n'
+        for name in sorted(self.phases, key=lambda n: -self.phases[n][1]):
+            calls, time = self.phases[name]
+            s = s + '  %-12s %8d calls %10.6fs\n' % (name, calls, time)
+        s = s + 'rules:\n'
+        for pattern in sorted(self.rules, key=lambda p: -self.rules[p][2]):
+            evaluations, matches, time = self.rules[pattern]
+            s = s + '  %-30s %8d evals %8d matches %10.6fs\n' % (pattern, evaluations, matches, time)
+        return s
+
+# The collector in use (None if disabled)
+collector = None
+
+# Returns the collector in use (or None if disabled)
+def current():
+    return collector
+
+# Enables stats collection
+# - stats : a collector (any object providing Stats.phase and Stats.rule)
+def enable(stats = None):
+    global collector
+    collector = Stats() if stats is None else stats
+    return collector
+def disable():
+    global collector
+    collector = None
+
+# Times a phase (see phase())
+class _Phase:
+    def __init__(self, name):
+        self.name = name
+    def __enter__(self):
+        self.start = clock()
+        return self
+    def __exit__(self, type, value, traceback):
+        if not collector is None: collector.phase(self.name, clock() - self.start)
+        return False
+
+class _NoPhase:
+    def __enter__(self):
+        return self
+    def __exit__(self, type, value, traceback):
+        return False
+_noPhase = _NoPhase()
+
+# Returns a context manager which times a phase
+# i.e. with stats.phase('walk'): ...
+def phase(name):
+    if collector is None: return _noPhase
+    return _Phase(name)
+
+#Unitary Tests
+if __name__ == "__main__":
+    # the module is imported, as __main__ is not the module compileRules sees
+    import stats
+    import addRules
+    import compileRules
+    if not stats.phase('walk') is stats._noPhase: raise Exception('disabled')
+    s = stats.enable()
+    with stats.phase('walk'):
+        pass
+    rs = addRules.RuleSet([addRules.Rule('*.o'), addRules.Rule('*.c')])
+    if not compileRules.compile(rs).match('a.c', False): raise Exception('match')
+    if compileRules.compile(rs).match('a.h', False): raise Exception('match')
+    if not s.phases['walk'][0] == 1: raise Exception('phase')
+    # the last rule decides first: '*.o' is not evaluated for 'a.c'
+    if not s.rules['*.o'][0:2] == [1, 0]: raise Exception(s.rules['*.o'])
+    if not s.rules['*.c'][0:2] == [2, 1]: raise Exception(s.rules['*.c'])
+    import os
+    import tempfile
+    fd, rulesfile = tempfile.mkstemp()
+    os.write(fd, '# multi-level rules\na/b\n!a/c\n')
+    os.close(fd)
+    try:
+        rs = addRules.RuleSet().loadfromfile(rulesfile)
+        sub = compileRules.compile(compileRules.subRules(rs, 'a'))
+        if not (sub.match('b', False) and not sub.match('c', False)): raise Exception('match')
+        if not s.rules[rulesfile + ':2:a/b'][0:2] == [1, 1]: raise Exception('a/b is counted as its own rule')
+        if not s.rules[rulesfile + ':3:!a/c'][0:2] == [2, 1]: raise Exception('!a/c is counted as its own rule')
+    finally:
+        os.remove(rulesfile)
+    print s
+    stats.disable()
+    print ""
+    print "utests ends with success"
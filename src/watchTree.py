@@ -0,0 +1,103 @@
+#!/usr/bin/python
+import os
+import time
+import folderTree
+import applyRules
+
+# A Watcher keeps a Tree (see applyRules.apply or walk) up to date
+# by polling the folders and the rules files modification time
+# - filenames : rules files (ruleset name is the filename)
+# - prune : rulesets names of the folders not listed (see applyRules.walk, default: filenames)
+#           such a folder is not watched
+class Watcher:
+    def __init__(self, tree, filenames = None, prune = None):
+        self.tree = tree
+        self.filenames = ['.gitignore'] if filenames is None else filenames
+        self.prune = folderTree.toMatches(self.filenames if prune is None else prune)
+        self.stamps = {}
+        for key in tree:
+            self.__snapshot(key, tree[key])
+    def __snapshot(self, path, folder):
+        self.stamps[path] = _mtime(path)
+        for filename in self.filenames:
+            if filename in folder.content:
+                filepath = os.path.join(path, filename)
+                self.stamps[filepath] = _mtime(filepath)
+        for key in folder.content:
+            value = folder.content[key]
+            if value.type == folderTree.FOLDER and not (value.matches or 0) & self.prune:
+                self.__snapshot(os.path.join(path, key), value)
+    # Checks the file system once, and updates the tree
+    # Returns the list of changed paths
+    def poll(self):
+        changed = []
+        for path in self.stamps:
+            if not _mtime(path) == self.stamps[path]:
+                changed.append(path)
+        if len(changed) == 0: return changed
+        root = list(self.tree)[0]
+        for relpath in applyRules.update(self.tree, changed, self.filenames, self.prune):
+            path = os.path.join(root, relpath) if relpath else root
+            for key in list(self.stamps):
+                if key == path or key.startswith(path + os.sep):
+                    del self.stamps[key]
+            lineage = applyRules.folderLineage(self.tree, relpath)
+            self.__snapshot(path, lineage[-1][1])
+        return changed
+    # Polls the file system forever
+    # - callback : called with the list of changed paths
+    def watch(self, interval = 1.0, callback = None):
+        while True:
+            changed = self.poll()
+            if len(changed) > 0 and not callback is None: callback(changed)
+            time.sleep(interval)
+
+# Returns the modification time of a path (None if it doesn't exist)
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+#Unitary Tests
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    root = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(root, 'src'))
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\n')
+        open(os.path.join(root, 'src', 'a.c'), 'wb').write('')
+        tree = applyRules.walk(root)
+        watcher = Watcher(tree)
+        if not watcher.poll() == []: raise Exception('nothing has changed')
+        past = time.time() - 10
+        open(os.path.join(root, 'src', 'a.o'), 'wb').write('')
+        os.utime(os.path.join(root, 'src'), (past, past))
+        if not len(watcher.poll()) == 1: raise Exception('src has changed')
+        if not '.gitignore' in tree.first().content['src'].content['a.o'].matches: raise Exception('a.o')
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\n*.c\n')
+        os.utime(os.path.join(root, '.gitignore'), (past, past))
+        watcher.poll()
+        if not '.gitignore' in tree.first().content['src'].content['a.c'].matches: raise Exception('a.c')
+        os.remove(os.path.join(root, 'src', 'a.c'))
+        os.utime(os.path.join(root, 'src'), (past - 10, past - 10))
+        watcher.poll()
+        if 'a.c' in tree.first().content['src'].content: raise Exception('a.c removed')
+        if not sorted(folderTree.tolist(tree, ['!.gitignore'])) == sorted(folderTree.tolist(applyRules.walk(root), ['!.gitignore'])): raise Exception('update')
+        open(os.path.join(root, '.gitignore'), 'wb').write('*.o\n*.c\nnode_modules/\ndist/\n')
+        os.mkdir(os.path.join(root, 'node_modules'))
+        watcher.poll()
+        stamps = len(watcher.stamps)
+        for i in range(0, 5):
+            os.makedirs(os.path.join(root, 'node_modules', 'package%d' % i, 'lib'))
+        os.makedirs(os.path.join(root, 'dist', 'lib'))
+        watcher.poll()
+        if not len(tree.first().content['node_modules'].content) == 0: raise Exception('pruned folder listed')
+        if not len(tree.first().content['dist'].content) == 0: raise Exception('added pruned folder listed')
+        if not len(watcher.stamps) == stamps: raise Exception('pruned folders watched')
+        if not sorted(folderTree.tolist(tree)) == sorted(folderTree.tolist(applyRules.walk(root))): raise Exception('update and walk differ')
+    finally:
+        shutil.rmtree(root)
+    print ""
+    print "utests ends with success"